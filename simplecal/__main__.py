@@ -1,5 +1,7 @@
 """Entrypoint"""
 import argparse
+import atexit
+import collections
 import json
 import sys
 import logging
@@ -22,6 +24,28 @@ def get_args():
     type=functools.partial(dateutil.parser.parse, dayfirst=True),
     default=datetime.date.today(),
     help='Show the given date instead of the current one.')
+    parser.add_argument('-s', '--search', metavar='QUERY',
+    help='Print events matching the query with their next occurrence and exit.')
+    parser.add_argument('--convert', nargs=2, metavar=('SOURCE', 'TARGET'),
+    help='Copy all events from SOURCE to TARGET and exit. '
+    'Calendars ending in .sqlite, .sqlite3 or .db are SQLite databases; others not ending in .ics '
+    '(optionally .gz, .bz2 or .xz) are directories with one file per event.')
+    parser.add_argument('--import', nargs='+', metavar='ICS', dest='import_files',
+    help='Merge the events of the given .ics files into the calendar of -w and exit. '
+    'Of events with the same UID, the one with the latest DTSTAMP is kept.')
+    parser.add_argument('--report', nargs=2, metavar=('START', 'END'),
+    type=functools.partial(dateutil.parser.parse, dayfirst=True),
+    help='Print time spent per category between START and END and exit.')
+    parser.add_argument('--conflicts', nargs=2, metavar=('START', 'END'),
+    type=functools.partial(dateutil.parser.parse, dayfirst=True),
+    help='Print overlapping events between START and END and exit.')
+    parser.add_argument('--alarms', action='store_true',
+    help='Do not open the GUI, print alarms of the calendars when they are due.')
+    parser.add_argument('-j', '--jobs', type=int,
+    help='Number of processes for --report. Default: number of CPUs.')
+    parser.add_argument('--memory-dump', metavar='FILE',
+    help='Trace memory allocations and write a report to FILE on exit. '
+    'The GUI takes a snapshot each time the display changes.')
     parser.add_argument('-V', '--version', action='store_true',
     help='Show version and exit.')
     parser.add_argument('-v', '--verbose', action='count', default=0,
@@ -53,22 +77,94 @@ def main(args):
 
     # import only after config is loaded
     from . import gui
-    from . import callib
+    from . import memory
+    from . import storage
+    from . import subscribe
+
+    if args.convert:
+        storage.convert(*args.convert)
+        return
 
     calendars = []
+    tracker = None
+    if args.memory_dump:
+        memory.start()
+        tracker = memory.MemoryTracker(calendars)
+        atexit.register(tracker.dump, args.memory_dump)
+    if args.import_files and not args.write_calendar:
+        logging.error('--import needs a calendar to write to (-w)')
+        sys.exit(1)
     if args.write_calendar:
         try:
-            calendars.append(callib.Calendar(args.write_calendar))
+            calendars.append(storage.open_calendar(args.write_calendar))
         except Exception as e:
             logging.error(f'Failed to read calendar file "{args.write_calendar}": {e}')
             sys.exit(1)
     for c in args.calendar:
         try:
-            calendars.append(callib.Calendar(c))
+            calendars.append(storage.open_calendar(c))
         except Exception as e:
             logging.error(f'Failed to read calendar file "{c}": {e}')
+    if args.search is not None or args.report or args.conflicts or args.alarms:
+        for cal in calendars:
+            if isinstance(cal, subscribe.RemoteCalendar):
+                cal.wait_loaded()
+    if tracker is not None:
+        tracker.snapshot('loaded')
+
+    if args.import_files:
+        try:
+            stats = storage.import_ics(calendars[0], args.import_files)
+        except OSError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        print(', '.join(f'{stats[k]} {k}' for k in ('added', 'updated', 'unchanged')))
+        return
+
+    if args.search is not None:
+        from . import search
+        storage.load_archives(calendars)
+        events = collections.ChainMap(*(c.events for c in calendars))
+        index = search.SearchIndex(events.values())
+        for event, occurrence in index.results(args.search, events):
+            print(search.format_result(event, occurrence, config.get('time_format')))
+        return
+
+    if args.report:
+        from . import callib
+        from . import report
+        start, end = map(callib.force_tz, args.report)
+        storage.load_archives(calendars, start)
+        expand = functools.partial(report.expand, processes=args.jobs)
+        usage = report.category_usage(callib.calendar_occurrences(calendars, start, end, expand))
+        for cat, (count, duration) in sorted(usage.items()):
+            print(f'{cat or "(none)":<20} {count:>8} {duration.total_seconds()/3600:>10.1f}h')
+        return
+
+    if args.conflicts:
+        from . import callib
+        start, end = map(callib.force_tz, args.conflicts)
+        storage.load_archives(calendars, start)
+        time_format = '%Y-%m-%d ' + config.get('time_format')
+        occurrences = callib.calendar_occurrences(calendars, start, end)
+        for a, b in callib.find_conflicts(occurrences):
+            print(f'{a.start.strftime(time_format)} {a.summary} <-> '
+                  f'{b.start.strftime(time_format)} {b.summary}')
+        return
+
+    if args.alarms:
+        from . import alarms
+        events = collections.ChainMap(*(c.events for c in calendars))
+        time_format = config.get('time_format')
+        scheduler = alarms.AlarmScheduler(events, lambda alarm, occ: print(
+            alarms.format_alarm(alarm, occ, time_format), flush=True))
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            pass
+        return
 
-    gui.run_app(args.display, calendars, bool(args.write_calendar))
+    gui.run_app(args.display, calendars, bool(args.write_calendar), tracker)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,113 @@
+"""alarm scheduling"""
+import datetime
+import heapq
+import itertools
+import logging
+import time
+import dateutil.tz
+from . import callib
+
+MAX_SLEEP = 60  # seconds; re-check at least this often in case the clock jumps
+
+
+def now():
+    return datetime.datetime.now(dateutil.tz.UTC)
+
+
+def occurrence_alarms(event, after):
+    """Yield (trigger time, alarm, occurrence) of each alarm of ``event``
+
+    Only the first trigger after ``after`` is computed for every alarm of
+    the series; overrides carry their own alarms.
+    """
+    for alarm in event.alarms:
+        if isinstance(alarm.trigger, datetime.datetime):
+            if alarm.trigger > after:
+                yield alarm.trigger, alarm, event.starting_at(event.start)
+            continue
+        offset = alarm.trigger + (event.duration if alarm.related_end else datetime.timedelta())
+        for dt in event.rrule.xafter(after - offset):
+            if dt not in event.overrides:
+                yield dt + offset, alarm, event.starting_at(dt)
+                break
+    for e in event.overrides.values():
+        occ = callib.Occurrence(e, e.start, e.end, True)
+        for alarm in e.alarms:
+            trigger = alarm.trigger_for(occ)
+            if trigger > after:
+                yield trigger, alarm, occ
+
+
+class AlarmScheduler:
+    """Fire alarms of all events in time order
+
+    A min-heap holds only the next trigger of every alarm of every
+    series. When one fires, just that alarm's next trigger is computed.
+    Entries of edited events are invalidated lazily through a per-UID
+    version number.
+    """
+    def __init__(self, events, fire):
+        self.events = events
+        self.fire = fire
+        self.heap = []
+        self.versions = {}
+        self.counter = itertools.count()
+        start = now()
+        for uid in events:
+            self.schedule(uid, start)
+
+    def schedule(self, uid, after):
+        version = self.versions[uid] = self.versions.get(uid, 0) + 1
+        if uid not in self.events:
+            return
+        for trigger, alarm, occ in occurrence_alarms(self.events[uid], after):
+            self.push(uid, version, trigger, alarm, occ)
+
+    def push(self, uid, version, trigger, alarm, occ):
+        heapq.heappush(self.heap, (
+            trigger.timestamp(), next(self.counter), uid, version, trigger, alarm, occ))
+
+    def reschedule(self, uid, version, alarm, after):
+        """Push the next trigger of ``alarm`` after ``after``"""
+        if uid not in self.events:  # deleted behind our back, e.g. by a sync
+            return
+        for trigger, a, occ in occurrence_alarms(self.events[uid], after):
+            if a is alarm:
+                self.push(uid, version, trigger, alarm, occ)
+                return
+
+    def update(self, uid):
+        """Recompute the next alarm of ``uid`` after it was edited or deleted"""
+        self.schedule(uid, now())
+
+    def run_due(self):
+        """Fire all due alarms; return seconds until the next one (or None)"""
+        current = now()
+        while self.heap and self.heap[0][0] <= current.timestamp():
+            __, __, uid, version, trigger, alarm, occ = heapq.heappop(self.heap)
+            if self.versions.get(uid) != version:
+                continue
+            try:
+                self.fire(alarm, occ)
+            except Exception:
+                logging.exception('failed to fire alarm for %s', occ)
+            self.reschedule(uid, version, alarm, trigger)
+        while self.heap and self.versions.get(self.heap[0][2]) != self.heap[0][3]:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - time.time())
+
+    def run_forever(self):
+        """Headless loop: sleep until the next alarm and fire it"""
+        while True:
+            delay = self.run_due()
+            time.sleep(MAX_SLEEP if delay is None else min(delay, MAX_SLEEP))
+
+
+def format_alarm(alarm, occ, time_format='%H:%M'):
+    when = 'all day' if occ.all_day else occ.start.strftime(time_format)
+    text = f'{occ.summary} ({occ.start:%Y-%m-%d} {when})'
+    if alarm.description and alarm.description != occ.summary:
+        text += f': {alarm.description}'
+    return text
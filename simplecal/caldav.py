@@ -0,0 +1,271 @@
+"""two-way sync with a CalDAV collection"""
+import base64
+import hashlib
+import http.client
+import json
+import logging
+import os
+import urllib.parse
+import xml.etree.ElementTree as ET
+import icalendar
+from . import callib
+from . import storage
+
+cache_dir = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'simplecal', 'caldav',
+)
+URL_PREFIXES = ('caldav+http://', 'caldav+https://')
+MULTIGET_BATCH = 100
+NS = {'d': 'DAV:', 'c': 'urn:ietf:params:xml:ns:caldav'}
+
+
+def dav(tag):
+    return '{DAV:}' + tag
+
+
+def sync_collection_body(token):
+    root = ET.Element(dav('sync-collection'))
+    ET.SubElement(root, dav('sync-token')).text = token
+    ET.SubElement(root, dav('sync-level')).text = '1'
+    ET.SubElement(ET.SubElement(root, dav('prop')), dav('getetag'))
+    return ET.tostring(root)
+
+
+def multiget_body(hrefs):
+    root = ET.Element('{urn:ietf:params:xml:ns:caldav}calendar-multiget')
+    prop = ET.SubElement(root, dav('prop'))
+    ET.SubElement(prop, dav('getetag'))
+    ET.SubElement(prop, '{urn:ietf:params:xml:ns:caldav}calendar-data')
+    for href in hrefs:
+        ET.SubElement(root, dav('href')).text = urllib.parse.quote(href)
+    return ET.tostring(root)
+
+
+def parse_multistatus(data):
+    """Return ({href: (etag, calendar data)}, sync token)
+
+    Etag is None for resources reported as gone, calendar data is None if
+    it was not requested.
+    """
+    root = ET.fromstring(data)
+    r = {}
+    for response in root.iterfind('d:response', NS):
+        href = urllib.parse.unquote(urllib.parse.urlsplit(
+            response.findtext('d:href', '', NS).strip()).path)
+        status = response.findtext('d:status', '', NS)
+        if ' 404 ' in status:
+            r[href] = None, None
+            continue
+        for propstat in response.iterfind('d:propstat', NS):
+            if ' 200 ' not in propstat.findtext('d:status', ' 200 ', NS):
+                continue
+            r[href] = (propstat.findtext('d:prop/d:getetag', None, NS),
+                       propstat.findtext('d:prop/c:calendar-data', None, NS))
+    return r, root.findtext('d:sync-token', None, NS)
+
+
+def without_credentials(url):
+    """Return ``url`` without the user:password@ part"""
+    parts = urllib.parse.urlsplit(url)
+    netloc = parts.netloc.rpartition('@')[2]
+    return urllib.parse.urlunsplit(parts._replace(netloc=netloc))
+
+
+class DAVError(OSError):
+    def __init__(self, method, path, response):
+        super().__init__(f'{method} {path} failed: {response.status} {response.reason}')
+        self.status = response.status
+
+
+class CalDAVCalendar(callib.CalendarBase):
+    """Calendar synced with a CalDAV collection
+
+    Events live in a local calendar directory (see storage.DirCalendar)
+    that mirrors the collection. Pulling uses a sync-collection REPORT
+    with the last sync token, so only resources whose ETag changed are
+    fetched, in batched calendar-multiget REPORTs. ``write`` uploads the
+    events changed locally with If-Match before pulling. All requests
+    share one persistent connection.
+    """
+    def __init__(self, url):
+        parts = urllib.parse.urlsplit(url.split('+', 1)[1])
+        # shown in menus, reports and errors, so keep the password out of it
+        self.file = without_credentials(url)
+        self.scheme, self.host = parts.scheme, parts.hostname
+        self.port = parts.port
+        self.path = urllib.parse.unquote(parts.path.rstrip('/')) + '/'
+        self.headers = {}
+        if parts.username:
+            credentials = f'{urllib.parse.unquote(parts.username)}:' \
+                          f'{urllib.parse.unquote(parts.password or "")}'
+            self.headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode()).decode()
+        self.conn = None
+
+        # hash the full URL, so each account on a server has its own cache
+        name = hashlib.sha256(url.encode()).hexdigest()
+        directory = os.path.join(cache_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        self.state_file = os.path.join(cache_dir, name + '.json')
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        self.token = state.get('token', '')
+        # href -> [etag, uid]
+        self.resources = state.get('resources', {})
+        self.pending = set(state.get('pending', ()))
+        self.local = storage.DirCalendar(directory)
+        self.events = self.local.events
+        self.pulled = set()  # by write, see take_changes
+        try:
+            self.sync()
+        except OSError as e:
+            if not self.token:
+                raise
+            logging.warning(f'Failed to sync "{self.path}", using cached events: {e}')
+
+    def request(self, method, path, body=None, headers=()):
+        """Send a request on the persistent connection, return (response, body)"""
+        headers = {**self.headers, **dict(headers)}
+        if body is not None:
+            headers.setdefault('Content-Type', 'application/xml; charset=utf-8')
+        for retry in (False, True):
+            if self.conn is None:
+                cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+                self.conn = cls(self.host, self.port, timeout=60)
+            try:
+                self.conn.request(method, urllib.parse.quote(path), body, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # server closed the kept-alive connection, reconnect once
+                self.conn.close()
+                self.conn = None
+                if retry:
+                    raise
+                continue
+            if response.will_close:
+                self.conn.close()
+                self.conn = None
+            return response, data
+
+    def sync(self):
+        """Pull changes from the server; return the UIDs that changed"""
+        response, data = self.request('REPORT', self.path, sync_collection_body(self.token))
+        if response.status in (403, 409) and self.token:
+            # token no longer valid, start over
+            logging.info(f'sync token for "{self.path}" expired, fetching everything')
+            self.token = ''
+            response, data = self.request('REPORT', self.path, sync_collection_body(''))
+        if response.status != 207:
+            raise DAVError('REPORT', self.path, response)
+        changes, token = parse_multistatus(data)
+        if not self.token:
+            # initial sync lists all resources, the others are gone
+            changes.update({href: (None, None) for href in self.resources.keys() - changes.keys()})
+        changes.pop(self.path, None)
+        fetch = [href for href, (etag, __) in changes.items()
+                 if etag is not None and self.resources.get(href, [None])[0] != etag]
+        changed = set()
+        try:
+            for href, (etag, __) in changes.items():
+                if etag is None and href in self.resources:
+                    changed |= self.apply_resource(href, None, None)
+            for i in range(0, len(fetch), MULTIGET_BATCH):
+                batch = fetch[i:i+MULTIGET_BATCH]
+                response, data = self.request(
+                    'REPORT', self.path, multiget_body(batch), {'Depth': '1'})
+                if response.status != 207:
+                    raise DAVError('REPORT', self.path, response)
+                for href, (etag, ics) in parse_multistatus(data)[0].items():
+                    changed |= self.apply_resource(href, etag, ics)
+            self.token = token or self.token
+        finally:
+            # pulled changes are not pending uploads, only store them locally
+            self.local.write()
+            self.save_state()
+        logging.info(f'synced "{self.path}": {len(changed)} events changed')
+        return changed
+
+    def apply_resource(self, href, etag, ics):
+        """Replace the events of ``href`` with those in ``ics``"""
+        changed = set()
+        old = self.resources.pop(href, None)
+        if old is not None and old[1] in self.events and old[1] not in self.pending:
+            del self.events.data[old[1]]
+            self.events.dirty.add(old[1])
+            changed.add(old[1])
+        if ics is None:
+            return changed
+        try:
+            events, __ = callib.events_from_components(
+                icalendar.Calendar.from_ical(ics).subcomponents)
+        except ValueError as e:
+            logging.warning(f'Failed to parse "{href}": {e}')
+            return changed
+        for uid, evt in events.items():
+            if uid in self.pending:
+                continue
+            self.events.data[uid] = evt
+            self.events.dirty.add(uid)
+            changed.add(uid)
+        if events:
+            self.resources[href] = [etag, next(iter(events))]
+        return changed
+
+    def push(self):
+        """Upload local changes; conflicting ones are dropped, the server wins"""
+        hrefs = {uid: href for href, (__, uid) in self.resources.items()}
+        for uid in sorted(self.pending):
+            href = hrefs.get(uid) or self.path + uid.replace('/', '_') + '.ics'
+            etag = self.resources.get(href, [None])[0]
+            if uid in self.events:
+                ical = storage.new_ical()
+                ical.subcomponents = [
+                    *callib.vtimezones([self.events[uid]]), *self.events[uid].to_components()]
+                headers = {'Content-Type': 'text/calendar; charset=utf-8'}
+                headers.update({'If-Match': etag} if etag else {'If-None-Match': '*'})
+                method, body = 'PUT', ical.to_ical()
+            else:
+                if href not in self.resources:
+                    self.pending.discard(uid)
+                    continue
+                method, body, headers = 'DELETE', None, {'If-Match': etag} if etag else {}
+            response, __ = self.request(method, href, body, headers)
+            if response.status == 412:
+                logging.warning(f'Event {uid} was changed on the server, local change discarded')
+                # make the next sync list everything and fetch it again
+                self.resources.setdefault(href, [None, uid])[0] = None
+                self.token = ''
+            elif response.status == 404 and method == 'DELETE':
+                self.resources.pop(href, None)
+            elif response.status >= 300:
+                raise DAVError(method, href, response)
+            elif method == 'PUT':
+                # without an ETag, the next sync fetches the resource again
+                self.resources[href] = [response.getheader('ETag'), uid]
+            else:
+                self.resources.pop(href, None)
+            self.pending.discard(uid)
+
+    def save_state(self):
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'token': self.token, 'resources': self.resources,
+                       'pending': sorted(self.pending)}, f)
+        os.replace(tmp, self.state_file)
+
+    def take_changes(self):
+        pulled, self.pulled = self.pulled, set()
+        return pulled
+
+    def _write(self):
+        self.pending |= self.events.dirty
+        try:
+            self.push()
+            self.pulled |= self.sync()
+        finally:
+            self.local.write()
+            self.save_state()
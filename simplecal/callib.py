@@ -7,7 +7,19 @@ import uuid
 import sys
 import re
 import collections
+import contextlib
+import copy
+import functools
+import gzip
+import bz2
+import lzma
+import io
+import heapq
+import itertools
+import os
+import zoneinfo
 import icalendar
+from icalendar.timezone import tzid_from_tzinfo
 import dateutil.rrule as du_rrule
 import dateutil.tz
 
@@ -21,21 +33,97 @@ def force_tz(dt):
         return dt.astimezone(dateutil.tz.gettz())
 
 
+# how far one step of a rule with this FREQ moves; rules with other
+# frequencies or with COUNT are always iterated from DTSTART
+SEEK_PERIODS = {
+    'WEEKLY': datetime.timedelta(weeks=1),
+    'DAILY': datetime.timedelta(days=1),
+    'HOURLY': datetime.timedelta(hours=1),
+    'MINUTELY': datetime.timedelta(minutes=1),
+    'SECONDLY': datetime.timedelta(seconds=1),
+}
+WINDOW_CACHE_SIZE = 8
+COMPRESSED_SUFFIXES = {
+    '.gz': functools.partial(gzip.open, compresslevel=6),
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+
+class DateSet:
+    """Insertion-ordered set of dates that is extended into a new one
+
+    The sets made from one another by ``add`` share a dict and each only
+    sees its first entries, so adding to the newest one is O(1); adding
+    to an older one copies it first. Membership is tested with
+    ``force_tz``-ed datetimes, iterating gives the dates as they were added.
+    """
+    __slots__ = ('_index', '_size')
+
+    def __init__(self, dates=()):
+        self._index = {}  # force_tz(date) -> (position, date)
+        for dt in dates:
+            self._index.setdefault(force_tz(dt), (len(self._index), dt))
+        self._size = len(self._index)
+
+    def __contains__(self, dt):
+        return self._index.get(dt, (self._size,))[0] < self._size
+
+    def __iter__(self):
+        return (dt for __, dt in itertools.islice(self._index.values(), self._size))
+
+    def __len__(self):
+        return self._size
+
+    def __eq__(self, other):
+        if not isinstance(other, DateSet):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f'DateSet({list(self)!r})'
+
+    def keys(self):
+        """Iterate over the ``force_tz``-ed dates"""
+        return itertools.islice(self._index, self._size)
+
+    def add(self, dt):
+        """Return a DateSet with ``dt`` added, leaving this one unchanged"""
+        key = force_tz(dt)
+        if key in self:
+            return self
+        r = DateSet()
+        if self._size == len(self._index):
+            r._index = self._index
+        else:
+            r._index = dict(itertools.islice(self._index.items(), self._size))
+        r._index[key] = (self._size, dt)
+        r._size = self._size + 1
+        return r
+
+
 @dataclasses.dataclass
 class RRule:
-    """wrapper around dateutil.rruleset"""
+    """wrapper around dateutil.rrule
+
+    RDATEs and EXDATEs are kept in DateSets; exdates are filtered out of
+    the rules' occurrences by set lookups, so adding one with ``with_ex``
+    neither parses the rules again nor touches the other exdates.
+    """
     dtstart: datetime.datetime
     rules: tuple[dict] = ()
-    inc_dates: tuple[datetime.date] = ()
-    ex_dates: tuple[datetime.date] = ()
+    inc_dates: DateSet = ()
+    ex_dates: DateSet = ()
 
     du_rules: list[du_rrule.rrule] = dataclasses.field(init=False)
-    ruleset: du_rrule.rruleset = dataclasses.field(init=False)
+    _rdates: list[datetime.datetime] = dataclasses.field(init=False, repr=False, compare=False)
+    _windows: collections.OrderedDict = dataclasses.field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         self.dtstart = force_tz(self.dtstart)
         self.du_rules = []
-        self.ruleset = du_rrule.rruleset(cache=True)
+        self._rdates = []  # implicit ones, not written out
+        self._windows = collections.OrderedDict()
         for rule in self.rules:
             if 'UNTIL' in rule:
                 rule['UNTIL'] = force_tz(rule['UNTIL']).astimezone(dateutil.tz.UTC)
@@ -43,12 +131,79 @@ class RRule:
                 icalendar.vRecur(rule).to_ical().decode(),
                 dtstart=self.dtstart,
             )
-            self.ruleset.rrule(rule)
             self.du_rules.append(rule)
-        for dt in self.inc_dates:
-            self.ruleset.rdate(force_tz(dt))
-        for dt in self.ex_dates:
-            self.ruleset.exdate(force_tz(dt))
+        if not isinstance(self.inc_dates, DateSet):
+            self.inc_dates = DateSet(self.inc_dates)
+        if not isinstance(self.ex_dates, DateSet):
+            self.ex_dates = DateSet(self.ex_dates)
+
+    @property
+    def ruleset(self):
+        """rruleset of all occurrences, built on every access"""
+        ruleset = self.ruleset_from(None)
+        for dt in self.ex_dates.keys():
+            ruleset.exdate(dt)
+        return ruleset
+
+    def add_rdate(self, dt):
+        self._rdates.append(dt)
+        self._windows.clear()
+
+    def seek(self, rule, du_rule, before):
+        """Return ``du_rule`` restarted shortly before ``before`` if possible"""
+        period = SEEK_PERIODS.get(str(rule['FREQ']).upper())
+        if period is None or 'COUNT' in rule:
+            return du_rule
+        step = period * int(rule.get('INTERVAL', 1))
+        skip = (before.astimezone(self.dtstart.tzinfo) - self.dtstart) // step - 1
+        if skip <= 0:
+            return du_rule
+        return du_rule.replace(dtstart=self.dtstart + skip * step)
+
+    def between(self, after, before, inc=False):
+        """Return the occurrences between ``after`` and ``before``
+
+        Unlike a cached ``rruleset``, memory use is bounded: only the last
+        few queried windows are kept, and rules with a fixed period skip
+        ahead instead of iterating from DTSTART.
+        """
+        key = (after, before, inc)
+        if key in self._windows:
+            self._windows.move_to_end(key)
+            return self._windows[key]
+        r = self._windows[key] = tuple(
+            dt for dt in self.ruleset_from(after).between(after, before, inc)
+            if dt not in self.ex_dates
+        )
+        if len(self._windows) > WINDOW_CACHE_SIZE:
+            self._windows.popitem(last=False)
+        return r
+
+    def xafter(self, after, inc=False):
+        """Iterate over occurrences after ``after``, skipping ahead if possible"""
+        return (dt for dt in self.ruleset_from(after).xafter(after, inc=inc)
+                if dt not in self.ex_dates)
+
+    def ruleset_from(self, after):
+        """Return a rruleset valid for occurrences after ``after``, without exdates
+
+        ``after`` None gives all occurrences.
+        """
+        ruleset = du_rrule.rruleset()
+        for rule, du_rule in zip(self.rules, self.du_rules):
+            ruleset.rrule(du_rule if after is None else self.seek(rule, du_rule, after))
+        for dt in itertools.chain(self.inc_dates.keys(), self._rdates):
+            ruleset.rdate(dt)
+        return ruleset
+
+    def _derive(self, **changes):
+        """Return a copy with ``changes``, sharing the parsed rules"""
+        r = copy.copy(self)
+        for name, value in changes.items():
+            setattr(r, name, value)
+        r._rdates = list(self._rdates)
+        r._windows = collections.OrderedDict()
+        return r
 
     def with_rule(self, rule):
         if len(self.rules) not in (0, 1):
@@ -56,10 +211,51 @@ class RRule:
         return dataclasses.replace(self, rules=(rule,))
 
     def with_inc(self, dt):
-        return dataclasses.replace(self, inc_dates=self.inc_dates + (dt,))
+        return self._derive(inc_dates=self.inc_dates.add(dt))
 
     def with_ex(self, dt):
-        return dataclasses.replace(self, ex_dates=self.ex_dates + (dt,))
+        return self._derive(ex_dates=self.ex_dates.add(dt))
+
+
+@dataclasses.dataclass
+class Alarm:
+    """represent a VALARM"""
+    # relative to the start (or end, if related_end) or absolute
+    trigger: datetime.timedelta | datetime.datetime
+    action: str = 'DISPLAY'
+    description: str = ''
+    related_end: bool = False
+
+    @classmethod
+    def from_valarm(cls, ical_component):
+        trigger = ical_component['trigger']
+        dt = trigger.dt
+        if not isinstance(dt, datetime.timedelta):
+            dt = force_tz(dt)
+        return cls(
+            dt,
+            str(ical_component.get('action', 'DISPLAY')),
+            str(ical_component.get('description', '')),
+            trigger.params.get('RELATED', 'START').upper() == 'END',
+        )
+
+    def to_component(self):
+        r = icalendar.Alarm()
+        r.add('action', self.action)
+        if isinstance(self.trigger, datetime.datetime):
+            # absolute triggers must be UTC date-times (RFC 5545 3.8.6.3)
+            r.add('trigger', self.trigger.astimezone(dateutil.tz.UTC),
+                  parameters={'VALUE': 'DATE-TIME'})
+        else:
+            r.add('trigger', self.trigger, parameters={'RELATED': 'END'} if self.related_end else {})
+        r.add('description', self.description)
+        return r
+
+    def trigger_for(self, occurrence):
+        """Return the time this alarm goes off for ``occurrence``"""
+        if isinstance(self.trigger, datetime.datetime):
+            return self.trigger
+        return (occurrence.end if self.related_end else occurrence.start) + self.trigger
 
 
 @dataclasses.dataclass
@@ -76,6 +272,7 @@ class Event:
     mod_stamp: datetime.datetime = dataclasses.field(
         default_factory=lambda: datetime.datetime.now(dateutil.tz.UTC))
     overrides: dict[datetime.datetime, Event] = dataclasses.field(default_factory=dict)
+    alarms: list[Alarm] = dataclasses.field(default_factory=list)
     if sys.version_info >= (3, 10):
         _: dataclasses.KW_ONLY
     all_day: bool = None
@@ -102,7 +299,7 @@ class Event:
 
         if not (self.rrule.rules or self.rrule.inc_dates):
             # We always want a datetime here
-            self.rrule.ruleset.rdate(datetime.datetime(*self.start.timetuple()[:-4], tzinfo=force_tz(self.start).tzinfo))
+            self.rrule.add_rdate(datetime.datetime(*self.start.timetuple()[:-4], tzinfo=force_tz(self.start).tzinfo))
 
     @property
     def duration(self):
@@ -147,13 +344,12 @@ class Event:
             rrule,
             str(ical_component['uid']),
             ical_component['dtstamp'].dt,
+            alarms=[Alarm.from_valarm(c) for c in ical_component.subcomponents
+                    if c.name == 'VALARM'],
         )
 
     def starting_at(self, new_start):
-        new_end = new_start + self.duration
-        r = dataclasses.replace(self, start=new_start, end=new_end)
-        r.original = self.original
-        return r
+        return Occurrence(self, new_start, new_start + self.duration)
 
     def __str__(self):
         return f'<Event "{self.summary}" from {self.start} to {self.end}>'
@@ -181,6 +377,19 @@ class Event:
                 r.add(k, v)
         r.add('uid', self.uid)
         r.add('dtstamp', self.mod_stamp)
+        for alarm in self.alarms:
+            r.add_component(alarm.to_component())
+        return r
+
+    def to_components(self):
+        """Return VEVENTs for this event and each of its overrides"""
+        r = [self.to_component()]
+        for dt, e in self.overrides.items():
+            comp = e.to_component()
+            if not self._had_tz:
+                dt = dt.replace(tzinfo=None)
+            comp.add('recurrence-id', dt.date() if self.all_day else dt)
+            r.append(comp)
         return r
 
     def _mk_orig_dt(attr):
@@ -199,45 +408,373 @@ class Event:
     del _mk_orig_dt
 
 
-class Calendar:
-    def __init__(self, file):
-        with open(file) as f:
-            data = f.read()
-        self.file = file
-        self.ical = icalendar.Calendar.from_ical(data)
-        self.events = {}
-        overrides = collections.defaultdict(dict)
-        self.other_comps = []
-        for comp in self.ical.subcomponents:
-            if comp.name == 'VEVENT':
-                if 'recurrence-id' in comp:
-                    if 'range' in comp['recurrence-id'].params:
-                        logging.warning(f'cannot process RANGE param in event with RECURRENCE-ID, skipping')
-                        continue
-                    overrides[str(comp['uid']), comp['recurrence-id'].dt] = Event.from_vevent(comp)
-                else:
-                    self.events[str(comp['uid'])] = Event.from_vevent(comp)
+@dataclasses.dataclass(frozen=True, eq=False)
+class Occurrence:
+    """a single occurrence of an Event
+
+    Only the times are stored, everything else is looked up on ``event``.
+    For overridden occurrences, ``event`` is the overriding Event.
+    Compared and hashed by identity, like a view of ``event``.
+    """
+    event: Event
+    start: datetime.datetime
+    end: datetime.datetime
+    override: bool = False
+
+    def __getattr__(self, name):
+        if name == 'event':  # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.event, name)
+
+    @property
+    def original(self):
+        return self.event.original
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __str__(self):
+        return f'<Occurrence of "{self.summary}" from {self.start} to {self.end}>'
+
+    orig_start = Event.orig_start
+    orig_end = Event.orig_end
+
+
+def events_from_components(comps):
+    """Return a UID -> Event dict and a list of non-VEVENT components"""
+    events = {}
+    overrides = collections.defaultdict(dict)
+    other_comps = []
+    for comp in comps:
+        if comp.name == 'VEVENT':
+            if 'recurrence-id' in comp:
+                if 'range' in comp['recurrence-id'].params:
+                    logging.warning(f'cannot process RANGE param in event with RECURRENCE-ID, skipping')
+                    continue
+                overrides[str(comp['uid']), comp['recurrence-id'].dt] = Event.from_vevent(comp)
+            else:
+                events[str(comp['uid'])] = Event.from_vevent(comp)
+        else:
+            other_comps.append(comp)
+    for (uid, dt), e in overrides.items():
+        try:
+            events[uid].overrides[force_tz(dt)] = e
+        except KeyError as e:
+            logging.warning(f'failed to add recurrence-specific override for UID {uid}')
+    return events, other_comps
+
+
+class CalendarBase:
+    """Common interface of calendar storage backends
+
+    Subclasses provide ``file``, an ``events`` mapping and ``_write``.
+    """
+    _batch_depth = 0
+    _write_pending = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Apply changes to ``events`` as a unit
+
+        Calls to ``write`` inside the block are deferred to a single
+        write at its end. If the block raises, ``events`` is restored
+        and nothing is written. Mappings that track changes restore
+        their own state with ``snapshot`` and ``restore``.
+        """
+        events = self.events
+        backup = events.snapshot() if hasattr(events, 'snapshot') else dict(events)
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            if hasattr(events, 'restore'):
+                events.restore(backup)
             else:
-                self.other_comps.append(comp)
-        for (uid, dt), e in overrides.items():
-            try:
-                self.events[uid].overrides[force_tz(dt)] = e
-            except KeyError as e:
-                logging.warning(f'failed to add recurrence-specific override for UID {uid}')
+                events.clear()
+                events.update(backup)
+            raise
+        finally:
+            self._batch_depth -= 1
+        if not self._batch_depth and self._write_pending:
+            self.write()
+
+    def filter(self, start, end, expand=None):
+        """Return the occurrences overlapping ``start``-``end`` sorted by start
+
+        ``expand(events, start, end)`` expands events whose occurrences
+        are not indexed, by default ``sorted_occurrences``.
+        """
+        return (expand or sorted_occurrences)(self.events.values(), start, end)
+
+    def apply(self, updated=(), deleted=()):
+        """Store ``updated`` events and delete the UIDs in ``deleted``
+
+        Raises KeyError (and changes nothing) if a UID to delete is missing.
+        """
+        with self.batch():
+            for uid in deleted:
+                del self.events[uid]
+            for event in updated:
+                self.events[event.uid] = event
+
+    def take_changes(self):
+        """Return the UIDs changed by writing other than through ``events``, and forget them
+
+        E.g. those pulled from a server while syncing.
+        """
+        return set()
 
     def write(self):
-        event_comps = [evt.to_component() for evt in self.events.values()]
-        self.ical.subcomponents = self.other_comps + event_comps
-        with open(self.file, 'wb') as f:
-            f.write(self.ical.to_ical())
+        if self._batch_depth:
+            self._write_pending = True
+            return
+        self._write_pending = False
+        self._write()
+
+
+def opener_for(file):
+    """Return a function like ``open`` (de)compressing by the suffix of ``file``"""
+    return COMPRESSED_SUFFIXES.get(os.path.splitext(file)[1], open)
+
+
+def iter_components(f, props):
+    """Parse the components of the iCalendar file ``f`` one at a time
+
+    ``f`` is a text file; only one component is held in memory at a time.
+    The property lines of the VCALENDAR are appended to ``props``. A
+    VTIMEZONE is only known to the components after it, as usual.
+    Raises ValueError unless ``f`` holds exactly one VCALENDAR.
+    """
+    depth = 0
+    lines = []
+    seen = False
+    for line in f:
+        if not line.strip():
+            continue
+        upper = line[:6].upper()
+        if depth == 0:
+            if seen or line.rstrip('\r\n').upper() != 'BEGIN:VCALENDAR':
+                raise ValueError(f'Content line outside of VCALENDAR: {line.rstrip()!r}')
+            seen = True
+        if upper.startswith('BEGIN:'):
+            depth += 1
+        if depth == 1 and not upper.startswith(('BEGIN:', 'END:')):
+            props.append(line)
+        elif depth >= 2:
+            lines.append(line)
+        if upper.startswith('END:'):
+            depth -= 1
+            if depth == 1:
+                yield icalendar.Component.from_ical(''.join(lines))
+                lines = []
+    if depth or not seen:
+        raise ValueError('Unterminated or missing VCALENDAR')
+
+
+def iter_file_components(file, props=None):
+    """Parse the components of the (maybe compressed) .ics file ``file`` one at a time"""
+    with io.TextIOWrapper(opener_for(file)(file, 'rb'), encoding='utf-8-sig', newline='') as f:
+        yield from iter_components(f, [] if props is None else props)
+
+
+@functools.lru_cache(maxsize=None)
+def is_named_zone(tzid):
+    """Whether readers know ``tzid`` without a VTIMEZONE: IANA names and zone files"""
+    if tzid.startswith('/'):
+        return True
+    try:
+        zoneinfo.ZoneInfo(tzid)
+    except (ValueError, zoneinfo.ZoneInfoNotFoundError):
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def generated_vtimezone(tzid, tz):
+    return icalendar.Timezone.from_tzinfo(tz, tzid)
+
+
+def vtimezones(events):
+    """Return VTIMEZONEs for the zones used by ``events`` that need one"""
+    zones = {}
+    for evt in events:
+        for e in (evt, *evt.overrides.values()):
+            for dt in (e.orig_start(tz=True), e.orig_end(tz=True), *e.rrule.inc_dates, *e.rrule.ex_dates):
+                tz = getattr(dt, 'tzinfo', None)
+                if tz is not None:
+                    zones.setdefault(tzid_from_tzinfo(tz), tz)
+    return [generated_vtimezone(tzid, tz) for tzid, tz in sorted(zones.items())
+            if tzid and not is_named_zone(tzid)]
+
+
+def with_vtimezones(events, other_comps):
+    """Return ``other_comps`` and the VTIMEZONEs ``events`` need that it lacks"""
+    present = {str(c['tzid']) for c in other_comps if c.name == 'VTIMEZONE'}
+    return [*other_comps, *(c for c in vtimezones(events) if str(c['tzid']) not in present)]
+
+
+class Calendar(CalendarBase):
+    """Calendar in a single .ics file, optionally compressed (.ics.gz, .ics.bz2, .ics.xz)
+
+    Reading and writing stream through the (de)compressor, one component
+    at a time.
+    """
+    def __init__(self, file):
+        self.file = file
+        props = []
+        self.events, self.other_comps = events_from_components(iter_file_components(file, props))
+        # components are rebuilt from self.events when writing
+        self.ical = icalendar.Calendar.from_ical(
+            'BEGIN:VCALENDAR\r\n' + ''.join(props) + 'END:VCALENDAR\r\n')
+
+    def _write(self):
+        self.write_file(self.file, self.events.values(), self.other_comps)
+
+    def write_file(self, file, events, other_comps):
+        """Replace ``file`` by ``events`` and ``other_comps`` with this calendar's properties"""
+        events = list(events)
+        other_comps = with_vtimezones(events, other_comps)
+        event_comps = itertools.chain.from_iterable(evt.to_components() for evt in events)
+        tmp = file + '.tmp'
+        with opener_for(file)(tmp, 'wb') as f:
+            for chunk in iter_ical(self.ical, itertools.chain(other_comps, event_comps)):
+                f.write(chunk)
+        os.replace(tmp, file)
+
+
+def iter_ical(ical, components):
+    """Serialize ``ical`` with ``components`` as subcomponents piece by piece
+
+    The concatenated output is identical to ``ical.to_ical()``, but only
+    one component is serialized at a time.
+    """
+    lines = [ical.content_line(name, value, sorted=True).to_ical()
+             for name, value in ical.property_items(recursive=False)]
+    yield b'\r\n'.join(filter(None, lines[:-1])) + b'\r\n'
+    for comp in components:
+        yield comp.to_ical()
+    yield lines[-1] + b'\r\n'
 
 
 def filter_events(events, start, end):
-    """Yield events in the given time segment"""
+    """Yield occurrences of events in the given time segment"""
     for event in events:
-        for dt in event.rrule.ruleset.between(start - event.duration, end):
+        for dt in event.rrule.between(start - event.duration, end):
             if dt not in event.overrides:
-                yield event.starting_at(dt)
+                yield Occurrence(event, dt, dt + event.duration)
         for dt, e in event.overrides.items():
             if start <= dt <= end:
-                yield e
+                yield Occurrence(e, e.start, e.end, True)
+
+
+def shift_event(event, delta):
+    """Return a copy of ``event`` with all occurrences moved by ``delta``"""
+    rrule = RRule(
+        event.rrule.dtstart + delta,
+        tuple({**r, 'UNTIL': r['UNTIL'] + delta} if 'UNTIL' in r else dict(r)
+              for r in event.rrule.rules),
+        tuple(dt + delta for dt in event.rrule.inc_dates),
+        tuple(dt + delta for dt in event.rrule.ex_dates),
+    )
+    overrides = {dt + delta: shift_event(e, delta) for dt, e in event.overrides.items()}
+    return dataclasses.replace(
+        event,
+        start=event.start + delta,
+        end=event.end + delta,
+        rrule=rrule,
+        overrides=overrides,
+        alarms=[dataclasses.replace(a, trigger=a.trigger + delta)
+                if isinstance(a.trigger, datetime.datetime) else a
+                for a in event.alarms],
+        mod_stamp=datetime.datetime.now(dateutil.tz.UTC),
+    )
+
+
+def last_end(event):
+    """Return the end of the last occurrence of ``event``, None if indefinite"""
+    if any('COUNT' not in r and 'UNTIL' not in r for r in event.rrule.rules):
+        return None
+    ends = [e.end for e in event.overrides.values()]
+    last = event.rrule.ruleset.before(datetime.datetime.max.replace(tzinfo=dateutil.tz.UTC))
+    if last is not None:
+        ends.append(last + event.duration)
+    return max(ends, default=event.end)
+
+
+def next_occurrence(event, after):
+    """Return the first occurrence of ``event`` not ending before ``after``
+
+    Returns None if there is no such occurrence.
+    """
+    return next(iter_occurrences(event, after), None)
+
+
+def iter_occurrences(event, after, series=True):
+    """Iterate over the occurrences of ``event`` not ending before ``after`` in order
+
+    With ``series`` false, only the overrides are.
+    """
+    series = (
+        Occurrence(event, dt, dt + event.duration)
+        for dt in event.rrule.xafter(after - event.duration, inc=True)
+        if dt not in event.overrides
+    ) if series else ()
+    overrides = sorted((
+        Occurrence(e, e.start, e.end, True)
+        for e in event.overrides.values() if e.end >= after
+    ), key=lambda o: o.start.timestamp())
+    return heapq.merge(series, overrides, key=lambda o: o.start.timestamp())
+
+
+def merge_occurrences(events, after, series=None):
+    """Iterate over the occurrences of all ``events`` not ending before ``after`` in order
+
+    This is a lazy k-way merge of the per-event iterators: every series is
+    only expanded as far as the merge has been consumed, so open-ended
+    series cost nothing and stopping after a few occurrences is cheap.
+    If given, ``series(event)`` tells whether to expand an event's series
+    or only take its overrides.
+    """
+    return heapq.merge(
+        *(iter_occurrences(evt, after, series is None or series(evt)) for evt in events),
+        key=lambda o: o.start.timestamp(),
+    )
+
+
+def find_conflicts(occurrences):
+    """Yield pairs of overlapping occurrences
+
+    ``occurrences`` must be sorted by start. All-day occurrences are
+    ignored. This is a sweep keeping the occurrences still running in a
+    heap, so it is O(n log n) plus the number of conflicts.
+    """
+    running = []  # (end timestamp, counter, occurrence)
+    for n, occ in enumerate(occurrences):
+        if occ.all_day:
+            continue
+        start = occ.start.timestamp()
+        while running and running[0][0] <= start:
+            heapq.heappop(running)
+        for __, __, other in running:
+            yield other, occ
+        heapq.heappush(running, (occ.end.timestamp(), n, occ))
+
+
+def sorted_occurrences(events, start, end):
+    """Return the occurrences from ``filter_events`` sorted by start"""
+    return sorted(filter_events(events, start, end), key=lambda o: o.start.timestamp())
+
+
+def calendar_occurrences(calendars, start, end, expand=None):
+    """Iterate over the occurrences of ``calendars`` in ``start``-``end`` by start
+
+    Every calendar answers with its ``filter``. As in a ChainMap of their
+    events, an event hides those with its UID in later calendars.
+    """
+    def visible(occurrences, earlier):
+        return (o for o in occurrences if not any(o.uid in events for events in earlier))
+
+    parts = [visible(cal.filter(start, end, expand), [c.events for c in calendars[:i]])
+             for i, cal in enumerate(calendars)]
+    return heapq.merge(*parts, key=lambda o: o.start.timestamp())
@@ -19,6 +19,10 @@ DEFAULT = {
     'lum_threshold': 140,
     'grey_factor': 0.5,
     'autosave': True,
+    'show_conflicts': True,
+    'nav_delay': 80,
+    'agenda_size': 50,
+    'subscription_refresh': 3600,
     'tag_colors': {
         '': '#bbbb88',
     },
@@ -31,14 +35,29 @@ DEFAULT = {
         'eventDisplay': {
             'padx': 10,
         },
+        'conflict': {
+            'foreground': '#cc0000',
+        },
     },
     'timeline': {
         'past': 1,
         'future': 5,
         'jump': 3,
+        'day_size': 120,
+        'overscan': 2,
+    },
+    'grid': {
+        'first_hour': 0,
+        'last_hour': 24,
+    },
+    'sqlite_horizon': {
+        'past': 3650,
+        'future': 730,
     },
+    'archive_months': 0,
     'direct_styles': {},
     'save_pretty': False,
+    'debug_menu': False,
 }
 config = DEFAULT
 patches = {}
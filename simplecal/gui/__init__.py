@@ -4,12 +4,25 @@ from tkinter import ttk
 import tkinter.messagebox as tk_msg
 import tkinter.simpledialog as tk_dia
 import collections
+import datetime
+import functools
 import logging
 import dateutil.parser
+from .. import alarms
+from .. import callib
 from .. import config
+from .. import memory
+from .. import search
+from .. import storage
+from .. import subscribe
 from . import config_gui
 from . import display
 from . import editing
+from . import memory_gui
+from . import search_gui
+
+
+SUBSCRIPTION_POLL = 1000  # ms
 
 
 class MessageboxHandler(logging.Handler):
@@ -55,12 +68,41 @@ def apply_styles(widget):
             opts = {'background': color, 'foreground': fg}
             style.configure(name + suff, **opts)
             conf_grey(name + suff)
+            style.configure('conflict.' + name + suff, **{**opts, **config.get('styles', 'conflict')})
+            conf_grey('conflict.' + name + suff)
 
     for style_name, options in config.get('direct_styles').items():
         style.configure(style_name, **options)
 
 
-def create_menu(root, dis, save_cb):
+def create_filter_menu(main_menu, dis, calendars):
+    """Add a menu to show or hide categories and calendars"""
+    event_filter = dis.event_filter
+    filter_menu = tk.Menu(main_menu, tearoff=0)
+
+    def toggle(setter, key, var):
+        setter(key, var.get())
+        dis.refilter()
+
+    for cat in (*event_filter.bits, None):
+        var = tk.BooleanVar(main_menu, True)
+        filter_menu.add_checkbutton(
+            label='Other categories' if cat is None else cat,
+            variable=var,
+            command=functools.partial(toggle, event_filter.set_category, cat, var),
+        )
+    filter_menu.add_separator()
+    for i, cal in enumerate(calendars):
+        var = tk.BooleanVar(main_menu, True)
+        filter_menu.add_checkbutton(
+            label=cal.file,
+            variable=var,
+            command=functools.partial(toggle, event_filter.set_calendar, i, var),
+        )
+    main_menu.add_cascade(label='Filter', menu=filter_menu, underline=0)
+
+
+def create_menu(root, dis, save_cb, index, events, bulk_cb, tracker, calendars):
     main_menu = tk.Menu(root, relief='sunken')
     nav_menu = tk.Menu(main_menu, tearoff=0)
 
@@ -73,54 +115,166 @@ def create_menu(root, dis, save_cb):
         dis.display(day.date())
 
     nav_menu.add_command(label='Jump to', underline=0, command=jump_handler)
+    nav_menu.add_command(
+        label='Today',
+        underline=0,
+        accelerator='Home',
+        command=lambda: dis.display(datetime.date.today()),
+    )
     nav_menu.add_command(
         label='Previous',
         underline=0,
+        accelerator='Left',
         command=lambda: dis.move(-1),
     )
     nav_menu.add_command(
         label='Next',
         underline=0,
+        accelerator='Right',
         command=lambda: dis.move(1),
     )
+    for keys, offset in ((('<Left>', '<Prior>'), -1), (('<Right>', '<Next>'), 1)):
+        for key in keys:
+            root.bind(key, lambda _, o=offset: dis.move(o))
+    root.bind('<Home>', lambda _: dis.display(datetime.date.today()))
     if save_cb is not None:
         main_menu.add_command(label='Save', underline=0, command=save_cb)
+    if bulk_cb is not None:
+        main_menu.add_command(
+            label='Bulk edit',
+            underline=0,
+            command=lambda: editing.BulkEditPopup(root, events.maps[0], index, bulk_cb),
+        )
     main_menu.add_cascade(label='Navigation', menu=nav_menu, underline=0)
+    create_filter_menu(main_menu, dis, calendars)
+    main_menu.add_command(
+        label='Search',
+        underline=1,
+        command=lambda: search_gui.display_search_popup(root, dis, index, events),
+    )
     main_menu.add_command(
         label='Configuration',
         underline=0,
         command=lambda: config_gui.display_config_popup(root),
     )
+    if config.get('debug_menu') or tracker.reports:
+        debug_menu = tk.Menu(main_menu, tearoff=0)
+
+        def start_tracing():
+            memory.start()
+            tracker.snapshot('start')
+
+        debug_menu.add_command(label='Start memory tracing', underline=0, command=start_tracing)
+        debug_menu.add_command(
+            label='Memory report',
+            underline=0,
+            command=lambda: memory_gui.display_memory_popup(root, tracker),
+        )
+        main_menu.add_cascade(label='Debug', menu=debug_menu, underline=0)
     root.config(menu=main_menu)
 
 
-def run_app(date, calendars, allow_write):
+def poll_subscriptions(root, dis, calendars, events, index, alarm_timer):
+    """Swap in events of refreshed subscribed calendars, then reschedule"""
+    changed = False
+    for cal in calendars:
+        if not isinstance(cal, subscribe.RemoteCalendar):
+            continue
+        new = cal.take_update()
+        if new is None:
+            continue
+        for i, m in enumerate(events.maps):
+            if m is cal.events:
+                events.maps[i] = new
+        for uid in cal.events.keys() | new.keys():
+            index.remove(uid)
+            if uid in events:
+                index.add(events[uid])
+            dis.event_filter.update(uid)
+        alarm_timer.update(cal.events.keys() | new.keys())
+        cal.events = new
+        changed = True
+    if changed:
+        dis.display()
+    root.after(SUBSCRIPTION_POLL, poll_subscriptions,
+               root, dis, calendars, events, index, alarm_timer)
+
+
+class AlarmTimer:
+    """Sleep with ``after`` until the scheduler's next alarm is due"""
+    def __init__(self, root, scheduler):
+        self.root = root
+        self.scheduler = scheduler
+        self.after_id = None
+        self.check()
+
+    def check(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+        delay = self.scheduler.run_due()
+        if delay is None:
+            delay = alarms.MAX_SLEEP
+        self.after_id = self.root.after(
+            int(min(delay, alarms.MAX_SLEEP) * 1000) + 1, self.check)
+
+    def update(self, uids):
+        """Reschedule ``uids`` after they were edited or deleted"""
+        for uid in uids:
+            self.scheduler.update(uid)
+        self.check()
+
+
+def show_alarm(alarm, occurrence):
+    tk_msg.showinfo('Alarm', alarms.format_alarm(alarm, occurrence, config.get('time_format')))
+
+
+def run_app(date, calendars, allow_write, tracker=None):
     logging.root.addHandler(MessageboxHandler(logging.WARNING))
     root = tk.Tk()
     apply_styles(root)
     events = collections.ChainMap(*(c.events for c in calendars))
+    index = search.SearchIndex(events.values())
+    alarm_timer = AlarmTimer(root, alarms.AlarmScheduler(events, show_alarm))
     display_name = config.get('display')
     if display_name.startswith(('v', 'h')):
         vertical = display_name.startswith('v')
         display_name = display_name[1:]
     dis_cls = {
         'month': display.MonthDisplay,
+        'canvasmonth': display.CanvasMonthDisplay,
         'timeline': display.TimelineDisplay,
         'week': display.WeekDisplay,
+        'scroll': display.ScrollTimelineDisplay,
+        'agenda': display.AgendaDisplay,
+        'weekgrid': display.WeekGridDisplay,
+        'daygrid': display.DayGridDisplay,
     }[display_name]
 
     if allow_write:
+        def show_changes():
+            """Show the events changed by the last write, e.g. pulled from a server"""
+            uids = calendars[0].take_changes()
+            for uid in uids:
+                index.remove(uid)
+                if uid in events:
+                    index.add(events[uid])
+            alarm_timer.update(uids)
+            dis.update_events({uid: events.get(uid) for uid in uids})
+
         def save_cb():
             try:
                 calendars[0].write()
             except OSError as e:
                 logging.error(str(e))
+            show_changes()
 
         def edit_cb(evt):
             events[evt.uid] = evt
+            index.add(evt)
+            alarm_timer.update((evt.uid,))
             if config.get('autosave'):
                 save_cb()
-            dis.display()
+            dis.update_events({evt.uid: events.get(evt.uid)})
 
         def delete_cb(evt):
             try:
@@ -128,21 +282,60 @@ def run_app(date, calendars, allow_write):
             except KeyError:
                 logging.error(f'Event {evt} not in writable calendar')
             else:
+                index.remove(evt.uid)
                 if evt.uid in events:
                     logging.warning(f'Event {evt} still in non-writable calendar')
+                    index.add(events[evt.uid])
+                alarm_timer.update((evt.uid,))
                 if config.get('autosave'):
                     save_cb()
-                dis.display()
+                dis.update_events({evt.uid: events.get(evt.uid)})
+
+        def bulk_cb(updated, deleted):
+            try:
+                with calendars[0].batch():
+                    calendars[0].apply(updated, deleted)
+                    if config.get('autosave'):
+                        calendars[0].write()
+            except KeyError as e:
+                logging.error(f'Bulk edit failed, nothing changed: event {e} not found')
+                return
+            except OSError as e:
+                logging.error(str(e))
+            for uid in deleted:
+                index.remove(uid)
+                if uid in events:
+                    index.add(events[uid])
+            for evt in updated:
+                index.add(events[evt.uid])
+            uids = [*deleted, *(evt.uid for evt in updated)]
+            alarm_timer.update(uids)
+            dis.update_events({uid: events.get(uid) for uid in uids})
+            show_changes()
     else:
-        edit_cb = delete_cb = save_cb = None
+        edit_cb = delete_cb = save_cb = bulk_cb = None
 
     add_event, edit_event = editing.get_handlers(root, edit_cb, delete_cb)
     dis = dis_cls(root, date, events.values(), add_event, edit_event)
+    dis.event_filter = display.EventFilter(events)
+
+    def range_cb(start):
+        for uid in storage.load_archives(calendars, start):
+            index.add(events[uid])
+            dis.event_filter.update(uid)
+    dis.range_cb = range_cb
+    dis.query = functools.partial(callib.calendar_occurrences, calendars)
     try:
         dis.vertical = vertical
     except NameError:
         pass
+    if tracker is None:
+        tracker = memory.MemoryTracker(calendars)
+    tracker.root = root
+    dis.frame.bind('<<Displayed>>', lambda _: tracker.snapshot(f'display {dis.cur_day}'))
     dis.display()
     dis.frame.pack(expand=True, fill=tk.BOTH)
-    create_menu(root, dis, save_cb)
+    poll_subscriptions(root, dis, calendars, events, index, alarm_timer)
+    create_menu(root, dis, save_cb, index, events, bulk_cb, tracker, calendars)
     root.mainloop()
+    tracker.root = None
@@ -134,7 +134,8 @@ class BasicConfig(ConfigBase):
         ttk.Label(dframe, text='Display: ').pack(side=tk.LEFT)
         ttk.OptionMenu(
             dframe, self.dis_var, config.get('display'),
-            'month', 'vtimeline', 'htimeline', 'vweek', 'hweek',
+            'month', 'canvasmonth', 'vtimeline', 'htimeline', 'vweek', 'hweek', 'vscroll', 'hscroll',
+            'agenda', 'weekgrid', 'daygrid',
         ).pack(side=tk.LEFT)
         dframe.pack()
         self.autosave_btn = ttk.Checkbutton(frame, text='Autosave')
@@ -250,6 +251,8 @@ class AdvancedConfig(ConfigBase):
             IntSelector('past'),
             IntSelector('future'),
             IntSelector('jump'),
+            IntSelector('day_size'),
+            IntSelector('overscan'),
         ))
         tframe = ttk.Frame(frame)
         self.timeline_sels.init(tframe, conf['timeline'])
@@ -307,7 +310,7 @@ class TextSelector(SelectorBase):
 
 
 class ColorSelector(SelectorBase):
-    title_lookup = {'background': 'background color'}
+    title_lookup = {'background': 'background color', 'foreground': 'text color'}
 
     def init(self, conf):
         self.button = tk.Button(
@@ -336,6 +339,7 @@ class StyleConfig(ConfigBase):
         'dayOfWeek': (TextSelector('font'), ColorSelector('background')),
         'dateNumber': (TextSelector('font'), ColorSelector('background')),
         'eventDisplay': (TextSelector('font'), IntSelector('padx')),
+        'conflict': (TextSelector('font'), ColorSelector('foreground')),
     }.items())
 
     def __init__(self, frame, conf):
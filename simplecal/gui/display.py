@@ -1,10 +1,14 @@
 """display a calendar"""
 import tkinter as tk
 from tkinter import ttk
+import tkinter.font as tk_font
 import dataclasses
 import calendar
+import collections
 import functools
 import datetime
+import heapq
+import time
 import dateutil.tz
 from .. import callib
 from .. import config
@@ -16,7 +20,10 @@ class EventInfo:
     summary: str
     time: str
     color: str  # hex(hash(tag name or ''))
-    event: callib.Event
+    event: callib.Occurrence
+    conflict: bool = False
+    categories: int = -1  # bitmask, see EventFilter
+    calendar: int = 0  # bitmask, see EventFilter
 
 
 @dataclasses.dataclass
@@ -29,33 +36,107 @@ class DateInfo:
     events: list[EventInfo] = dataclasses.field(default_factory=list)
 
 
+RENDER_SLICE = 0.03  # seconds of rendering between handling other events
+
+
 class DisplayBase:
+    event_filter = None
+    range_cb = None  # called with the first date before days are expanded
+    query = None  # (start, end) -> occurrences sorted by start, instead of expanding all events
+
     def __init__(self, parent, cur_day, events, add_event, edit_event):
         self.frame = ttk.Frame(parent)
         self.events = events
         self.add_event_cb = add_event
         self.edit_event_cb = edit_event
         self.cur_day = cur_day
+        self._pending = None
+        self._render_id = 0
+        self.buckets = None
+        self.cells = {}
 
     def move(self, offset):
-        self.display(self._move(offset))
+        """Move by ``offset`` units
+
+        Rendering is delayed a little, so rapid moves are rendered once.
+        """
+        self.cur_day = self._move(offset)
+        if self._pending is not None:
+            self.frame.after_cancel(self._pending)
+        self._pending = self.frame.after(config.get('nav_delay'), self.display)
+
+    def cancel_pending(self):
+        if self._pending is not None:
+            self.frame.after_cancel(self._pending)
+            self._pending = None
 
     def display(self, day=None):
+        self.cancel_pending()
         if day is not None:
             self.cur_day = day
+        self._render_id += 1
         kill_all_children(self.frame)
-        self._display()
+        self.render_chunks(self._display() or (), self._render_id)
+        self.frame.event_generate('<<Displayed>>')
+
+    def update_events(self, changed):
+        """Show changes of the events in ``changed`` (UID -> Event or None)
+
+        Only these events are re-expanded and only the days showing them
+        are drawn again.
+        """
+        if self.event_filter is not None:
+            for uid in changed:
+                self.event_filter.update(uid)
+        self.patch_days(changed)
+
+    def patch_days(self, changed):
+        if self.buckets is None:
+            self.display()
+            return
+        dates = self.buckets.update(changed)
+        if dates:
+            self.redisplay_dates(dates)
+
+    def refilter(self):
+        """Show the events passing ``event_filter`` without expanding them again"""
+        if self.buckets is None:
+            self.display()
+            return
+        self.buckets.apply_filter()
+        self.redisplay_dates(self.buckets.dates)
+
+    def make_buckets(self, start, end, extra_before=0, extra_after=0):
+        if self.range_cb is not None:
+            self.range_cb(start - deltadays(extra_before))
+        return DayBuckets(
+            self.events, start, end, extra_before, extra_after, self.event_filter, self.query)
+
+    def redisplay_dates(self, dates):
+        for d in dates:
+            if d in self.cells:
+                kill_all_children(self.cells[d])
+                self.fill_cell(self.cells[d], self.buckets.dates[d])
+
+    def render_chunks(self, chunks, render_id):
+        """Run ``chunks`` (an iterator), yielding to Tk between time slices
+
+        Rendering stops when a newer ``display`` has started.
+        """
+        if render_id != self._render_id:
+            return
+        deadline = time.monotonic() + RENDER_SLICE
+        for __ in chunks:
+            if time.monotonic() > deadline:
+                self.frame.after(1, self.render_chunks, chunks, render_id)
+                return
 
     def make_event_frame(self, parent, date):
         st = get_style_helper(date)
         container = ttk.Frame(parent, style=st('dateCell.TFrame'))
         for evt in date.events:
-            conf_padx = config.get('styles', 'eventDisplay', 'padx')
-            if isinstance(conf_padx, int):
-                conf_padx = (conf_padx, conf_padx)
-            padx = [c*(t == date.id) for c, t in zip(conf_padx, evt.times)]
-
-            st_pre = st(f'{evt.color}.eventDisplay.')
+            padx = get_event_padx(date, evt)
+            st_pre = st(get_event_style(evt))
             frame = ttk.Frame(container, style=st_pre+'TFrame')
             labelL = ttk.Label(frame, text=evt.summary, style=st_pre+'TLabel')
             labelL.pack(side=tk.LEFT)
@@ -81,15 +162,16 @@ class MonthDisplay(DisplayBase):
         year, month = self.cur_day.year, self.cur_day.month
         first_wd, last_d = calendar.monthrange(year, month)
         extra_before = (first_wd - config.get('week_starts_on')) % 7
-        return generate_dateinfos(
-            self.events,
+        self.buckets = self.make_buckets(
             datetime.date(year, month, 1),
             datetime.date(year, month, last_d),
             extra_before,
             -(last_d + extra_before) % 7,
         )
+        return tuple(self.buckets.dates.values())
 
     def _display(self):
+        self.cells = {}
         for i, day in enumerate(config.get('days_of_week'), -config.get('week_starts_on')):
             ttk.Label(self.frame, text=day, style='dayOfWeek.TLabel'
                       ).grid(row=0, column=i%7)
@@ -99,15 +181,274 @@ class MonthDisplay(DisplayBase):
             self.display_date(date, *divmod(i, 7))
             if i % 7 == 0:
                 self.frame.grid_rowconfigure(i//7, weight=1)
+            yield
 
     def display_date(self, date, row, col):
         st = get_style_helper(date)
         cell_frame = ttk.Frame(self.frame, style=st('dateCell.TFrame'))
         cell_frame.grid(row=row, column=col, sticky=tk.NSEW)
+        self.fill_cell(cell_frame, date)
+        cell_frame.bind('<1>', lambda _: self.add_event_cb(date.date))
+        self.cells[date.date] = cell_frame
+
+    def fill_cell(self, cell_frame, date):
+        st = get_style_helper(date)
         ttk.Label(cell_frame, text=date.number, style=st('dateNumber.TLabel')
                   ).pack(anchor=tk.NW)
         self.make_event_frame(cell_frame, date)
-        cell_frame.bind('<1>', lambda _: self.add_event_cb(date.date))
+
+
+class CanvasMonthDisplay(MonthDisplay):
+    """Month view drawn on a single Canvas instead of a widget per event"""
+    def __init__(self, parent, cur_day, events, add_event, edit_event):
+        super().__init__(parent, cur_day, events, add_event, edit_event)
+        self.canvas = tk.Canvas(self.frame, highlightthickness=0)
+        self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.canvas.bind('<Configure>', lambda _: self.redraw())
+        self.canvas.bind('<1>', self.on_click)
+        self.style = ttk.Style(self.frame)
+        self.dateinfos = ()
+        self.layout = None
+
+    def display(self, day=None):
+        self.cancel_pending()
+        if day is not None:
+            self.cur_day = day
+        self.dateinfos = self.get_dateinfos()
+        self.redraw()
+        self.frame.event_generate('<<Displayed>>')
+
+    def redisplay_dates(self, dates):
+        self.redraw()
+
+    def lookup(self, style, option):
+        return self.style.lookup(style, option) or self.style.lookup('.', option)
+
+    def font(self, style):
+        return tk_font.Font(self.canvas, font=self.lookup(style, 'font'))
+
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete(tk.ALL)
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if width <= 1 or not self.dateinfos:
+            return  # not mapped yet, <Configure> will call again
+        dow_font = self.font('dayOfWeek.TLabel')
+        num_font = self.font('dateNumber.TLabel')
+        evt_font = self.font('eventDisplay.TLabel')
+        head_h = dow_font.metrics('linespace') + 4
+        num_h = num_font.metrics('linespace') + 2
+        bar_h = evt_font.metrics('linespace') + 2
+        rows = len(self.dateinfos) // 7
+        cell_w = width / 7
+        cell_h = (height - head_h) / rows
+        self.layout = (head_h, num_h, bar_h, cell_w, cell_h)
+
+        for i, day in enumerate(config.get('days_of_week'), -config.get('week_starts_on')):
+            canvas.create_text(
+                (i % 7 + 0.5) * cell_w, head_h / 2, text=day, font=dow_font,
+                fill=self.lookup('dayOfWeek.TLabel', 'foreground'),
+            )
+        for i, date in enumerate(self.dateinfos):
+            row, col = divmod(i, 7)
+            self.draw_date(date, col * cell_w, head_h + row * cell_h, num_font, evt_font)
+
+    def draw_date(self, date, x, y, num_font, evt_font):
+        canvas = self.canvas
+        head_h, num_h, bar_h, cell_w, cell_h = self.layout
+        st = get_style_helper(date)
+        canvas.create_rectangle(
+            x, y, x + cell_w, y + cell_h,
+            fill=self.lookup(st('dateCell.TFrame'), 'background'),
+            outline=self.lookup('.', 'bordercolor') or 'grey',
+        )
+        canvas.create_text(
+            x + 2, y + 1, text=date.number, font=num_font, anchor=tk.NW,
+            fill=self.lookup(st('dateNumber.TLabel'), 'foreground'),
+        )
+        fits = int((cell_h - num_h) // bar_h)
+        shown = date.events if len(date.events) <= fits else date.events[:max(fits-1, 0)]
+        for n, evt in enumerate(shown):
+            padl, padr = get_event_padx(date, evt)
+            top = y + num_h + n * bar_h
+            left, right = x + padl, x + cell_w - padr
+            st_pre = st(get_event_style(evt))
+            fg = self.lookup(st_pre + 'TLabel', 'foreground')
+            canvas.create_rectangle(
+                left, top, right, top + bar_h - 1, width=0,
+                fill=self.lookup(st_pre + 'TFrame', 'background'),
+            )
+            time_w = evt_font.measure(evt.time) + 4
+            canvas.create_text(
+                right - 2, top + 1, text=evt.time, font=evt_font, fill=fg, anchor=tk.NE)
+            canvas.create_text(
+                left + 2, top + 1, font=evt_font, fill=fg, anchor=tk.NW,
+                text=truncate_text(evt_font, evt.summary, right - left - time_w - 4),
+            )
+        if len(shown) < len(date.events):
+            canvas.create_text(
+                x + 2, y + num_h + len(shown) * bar_h, anchor=tk.NW, font=evt_font,
+                text=f'+{len(date.events) - len(shown)} more',
+                fill=self.lookup(st('dateNumber.TLabel'), 'foreground'),
+            )
+
+    def on_click(self, tk_evt):
+        if self.layout is None:
+            return
+        head_h, num_h, bar_h, cell_w, cell_h = self.layout
+        if tk_evt.y < head_h:
+            return
+        row, y_in = divmod(tk_evt.y - head_h, cell_h)
+        col = min(int(tk_evt.x // cell_w), 6)
+        index = int(row) * 7 + col
+        if index >= len(self.dateinfos):
+            return
+        date = self.dateinfos[index]
+        n = int((y_in - num_h) // bar_h)
+        fits = int((cell_h - num_h) // bar_h)
+        shown = len(date.events) if len(date.events) <= fits else fits - 1
+        if y_in >= num_h and n < shown:
+            padl, padr = get_event_padx(date, date.events[n])
+            if padl <= tk_evt.x - col * cell_w <= cell_w - padr:
+                self.edit_event_cb(date.events[n].event, tk_evt)
+                return
+        self.add_event_cb(date.date)
+
+
+class WeekGridDisplay(CanvasMonthDisplay):
+    """Week drawn as an hour grid, events placed by time
+
+    Overlapping events are packed into side-by-side columns, see
+    ``pack_columns``. All-day and multi-day events are listed in a strip
+    above the grid.
+    """
+    days = 7
+    max_all_day_rows = 3
+
+    def _move(self, offset):
+        return self.cur_day + deltadays(offset * self.days)
+
+    def first_day(self):
+        return self.cur_day - deltadays(
+            (self.cur_day.weekday()-config.get('week_starts_on')) % 7)
+
+    def get_dateinfos(self):
+        start = self.first_day()
+        self.buckets = self.make_buckets(start, start + deltadays(self.days - 1))
+        return tuple(self.buckets.dates.values())
+
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete(tk.ALL)
+        self.hits = []
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        if width <= 1 or not self.dateinfos:
+            return  # not mapped yet, <Configure> will call again
+        dow_font = self.font('dayOfWeek.TLabel')
+        num_font = self.font('dateNumber.TLabel')
+        evt_font = self.font('eventDisplay.TLabel')
+        line = self.lookup('.', 'bordercolor') or 'grey'
+        bar_h = evt_font.metrics('linespace') + 2
+        head_h = dow_font.metrics('linespace') + 4
+        gutter = num_font.measure('00:00') + 6
+        first_hour = config.get('grid', 'first_hour')
+        last_hour = config.get('grid', 'last_hour')
+
+        all_day = []
+        timed = []
+        for date in self.dateinfos:
+            day_start = datetime.datetime.combine(date.date, datetime.time())
+            intervals = []
+            strip = []
+            for evt in date.events:
+                occ = evt.event
+                start = callib.force_tz(occ.start).replace(tzinfo=None)
+                end = callib.force_tz(occ.end).replace(tzinfo=None)
+                if occ.all_day or end - start >= deltadays(1):
+                    strip.append(evt)
+                    continue
+                start = max((start - day_start).total_seconds() / 60, first_hour * 60)
+                end = min((end - day_start).total_seconds() / 60, last_hour * 60)
+                if end >= first_hour * 60 and start <= last_hour * 60:
+                    intervals.append((start, max(end, start), evt))
+            all_day.append(strip)
+            timed.append(pack_columns(intervals))
+        rows = min(max(map(len, all_day)), self.max_all_day_rows + 1)
+        grid_top = head_h + rows * bar_h + 2
+        day_w = (width - gutter) / self.days
+        minute_h = (height - grid_top) / max((last_hour - first_hour) * 60, 1)
+        self.layout = (gutter, head_h, grid_top, day_w, minute_h, first_hour)
+
+        for i, date in enumerate(self.dateinfos):
+            x = gutter + i * day_w
+            st = get_style_helper(date)
+            canvas.create_rectangle(
+                x, grid_top, x + day_w, height, outline=line,
+                fill=self.lookup(st('dateCell.TFrame'), 'background'),
+            )
+            canvas.create_line(x, 0, x, grid_top, fill=line)
+            canvas.create_text(
+                x + day_w / 2, head_h / 2, font=dow_font,
+                text=f'{date.weekday} {date.number}',
+                fill=self.lookup(st('dayOfWeek.TLabel'), 'foreground'),
+            )
+            shown = all_day[i] if len(all_day[i]) <= rows else all_day[i][:rows-1]
+            for n, evt in enumerate(shown):
+                top = head_h + n * bar_h
+                self.draw_event(evt, x + 1, top, x + day_w - 1, top + bar_h - 1, evt_font, st)
+            if len(shown) < len(all_day[i]):
+                canvas.create_text(
+                    x + 2, head_h + len(shown) * bar_h, anchor=tk.NW, font=evt_font,
+                    text=f'+{len(all_day[i]) - len(shown)} more',
+                    fill=self.lookup(st('dateNumber.TLabel'), 'foreground'),
+                )
+            for start, end, evt, column, columns in timed[i]:
+                col_w = day_w / columns
+                top = grid_top + (start - first_hour * 60) * minute_h
+                bottom = max(grid_top + (end - first_hour * 60) * minute_h, top + bar_h)
+                left = x + column * col_w
+                self.draw_event(evt, left + 1, top, left + col_w - 1, bottom - 1, evt_font, st)
+        for hour in range(first_hour, last_hour):
+            y = grid_top + (hour - first_hour) * 60 * minute_h
+            canvas.create_line(gutter, y, width, y, fill=line)
+            canvas.create_text(
+                gutter - 3, y, text=f'{hour:02}:00', font=num_font, anchor=tk.NE,
+                fill=self.lookup('dateNumber.TLabel', 'foreground'),
+            )
+        canvas.tag_raise('event')
+
+    def draw_event(self, evt, left, top, right, bottom, font, st):
+        st_pre = st(get_event_style(evt))
+        self.canvas.create_rectangle(
+            left, top, right, bottom, width=0, tags='event',
+            fill=self.lookup(st_pre + 'TFrame', 'background'),
+        )
+        self.canvas.create_text(
+            left + 2, top + 1, font=font, anchor=tk.NW, tags='event',
+            fill=self.lookup(st_pre + 'TLabel', 'foreground'),
+            text=truncate_text(font, f'{evt.time} {evt.summary}', right - left - 4),
+        )
+        self.hits.append((left, top, right, bottom, evt))
+
+    def on_click(self, tk_evt):
+        if self.layout is None:
+            return
+        for left, top, right, bottom, evt in reversed(self.hits):
+            if left <= tk_evt.x <= right and top <= tk_evt.y <= bottom:
+                self.edit_event_cb(evt.event, tk_evt)
+                return
+        gutter, head_h, grid_top, day_w, minute_h, first_hour = self.layout
+        if tk_evt.x < gutter:
+            return
+        date = self.dateinfos[min(int((tk_evt.x - gutter) // day_w), self.days - 1)]
+        self.add_event_cb(date.date)
+
+
+class DayGridDisplay(WeekGridDisplay):
+    days = 1
+
+    def first_day(self):
+        return self.cur_day
 
 
 class TimelineDisplay(DisplayBase):
@@ -118,27 +459,36 @@ class TimelineDisplay(DisplayBase):
         return self.cur_day + deltadays(offset*self.move_unit)
 
     def get_dateinfos(self):
-        return generate_dateinfos(
-            self.events,
+        self.buckets = self.make_buckets(
             self.cur_day,
             self.cur_day + deltadays(config.get('timeline', 'future')),
             config.get('timeline', 'past'),
         )
+        return tuple(self.buckets.dates.values())
 
     def _display(self):
+        self.cells = {}
         for date in self.get_dateinfos():
             st = get_style_helper(date)
-            frame = self.add_frame(st('dateCell.TFrame'))
-            hframe = ttk.Frame(frame, style=st('dateCell.TFrame'))
-            ttk.Label(
-                hframe, text=date.number, style=st('dateNumber.TLabel')
-            ).pack(side=tk.LEFT)
-            ttk.Label(
-                hframe, text=date.weekday, style=st('dayOfWeek.TLabel')
-            ).pack(side=tk.RIGHT)
-            hframe.pack(fill=tk.X, expand=True)
-            self.make_event_frame(frame, date)
-            hframe.bind('<1>', lambda _, d=date.date: self.add_event_cb(d))
+            self.cells[date.date] = self.add_frame(st('dateCell.TFrame'))
+            self.fill_day_frame(self.cells[date.date], date)
+            yield
+
+    def fill_cell(self, cell_frame, date):
+        self.fill_day_frame(cell_frame, date)
+
+    def fill_day_frame(self, frame, date):
+        st = get_style_helper(date)
+        hframe = ttk.Frame(frame, style=st('dateCell.TFrame'))
+        ttk.Label(
+            hframe, text=date.number, style=st('dateNumber.TLabel')
+        ).pack(side=tk.LEFT)
+        ttk.Label(
+            hframe, text=date.weekday, style=st('dayOfWeek.TLabel')
+        ).pack(side=tk.RIGHT)
+        hframe.pack(fill=tk.X, expand=True)
+        self.make_event_frame(frame, date)
+        hframe.bind('<1>', lambda _, d=date.date: self.add_event_cb(d))
 
     def add_frame(self, style):
         frame = ttk.Frame(self.frame, style=style)
@@ -153,13 +503,276 @@ class WeekDisplay(TimelineDisplay):
     def get_dateinfos(self):
         start = self.cur_day - deltadays(
             (self.cur_day.weekday()-config.get('week_starts_on')) % 7)
-        return generate_dateinfos(self.events, start, start + deltadays(6))
+        self.buckets = self.make_buckets(start, start + deltadays(6))
+        return tuple(self.buckets.dates.values())
+
+
+class ScrollTimelineDisplay(TimelineDisplay):
+    """Continuously scrolling timeline that only renders the days in view
+
+    Day frames leaving the viewport are recycled for newly exposed days,
+    and day infos are fetched incrementally as they come into view.
+    """
+    def __init__(self, parent, cur_day, events, add_event, edit_event):
+        super().__init__(parent, cur_day, events, add_event, edit_event)
+        self.canvas = tk.Canvas(self.frame, highlightthickness=0)
+        self.canvas.pack(expand=True, fill=tk.BOTH)
+        self.canvas.bind('<Configure>', lambda _: self.update_view())
+        toplevel = self.frame.winfo_toplevel()
+        toplevel.bind('<MouseWheel>', lambda e: self.scroll(-e.delta // 3), add=True)
+        toplevel.bind('<Button-4>', lambda _: self.scroll(-40), add=True)
+        toplevel.bind('<Button-5>', lambda _: self.scroll(40), add=True)
+        self.offset = 0
+        self.day_cache = {}
+        self.chunks = []  # DayBuckets the cached days come from
+        self.shown = {}  # ordinal -> (canvas window id, frame)
+        self.free = []
+
+    @property
+    def day_size(self):
+        return config.get('timeline', 'day_size')
+
+    @property
+    def origin(self):
+        return self.cur_day.toordinal() - config.get('timeline', 'past')
+
+    def move(self, offset):
+        self.scroll(offset * self.move_unit * self.day_size)
+
+    def display(self, day=None):
+        if day is not None:
+            self.cur_day = day
+            self.offset = 0
+        self.day_cache.clear()
+        self.chunks.clear()
+        self.free.extend(self.shown.values())
+        self.shown.clear()
+        self.update_view()
+        self.frame.event_generate('<<Displayed>>')
+
+    def scroll(self, pixels):
+        self.offset += pixels
+        if self._pending is None:
+            self._pending = self.frame.after_idle(self.update_view)
+
+    def update_view(self):
+        self.cancel_pending()
+        self._update_view()
+
+    def _update_view(self):
+        extent = self.canvas.winfo_height() if self.vertical else self.canvas.winfo_width()
+        cross = self.canvas.winfo_width() if self.vertical else self.canvas.winfo_height()
+        overscan = config.get('timeline', 'overscan')
+        size = self.day_size
+        first = self.origin + self.offset // size - overscan
+        last = self.origin + (self.offset + max(extent, 1)) // size + overscan
+        wanted = range(first, last + 1)
+
+        for ordinal in tuple(self.shown):
+            if ordinal not in wanted:
+                self.free.append(self.shown.pop(ordinal))
+        self.fetch(wanted)
+        for ordinal in wanted:
+            if ordinal not in self.shown:
+                self.shown[ordinal] = self.get_slot(self.day_cache[ordinal])
+            window_id, __ = self.shown[ordinal]
+            pos = (ordinal - self.origin) * size - self.offset
+            if self.vertical:
+                self.canvas.coords(window_id, 0, pos)
+                self.canvas.itemconfigure(window_id, width=cross, height=size, state=tk.NORMAL)
+            else:
+                self.canvas.coords(window_id, pos, 0)
+                self.canvas.itemconfigure(window_id, width=size, height=cross, state=tk.NORMAL)
+        for window_id, __ in self.free:
+            self.canvas.itemconfigure(window_id, state=tk.HIDDEN)
+
+    def fetch(self, ordinals):
+        missing = [o for o in ordinals if o not in self.day_cache]
+        if not missing:
+            return
+        if len(self.day_cache) > 4 * len(ordinals):
+            for ordinal in tuple(self.day_cache):
+                if ordinal not in ordinals:
+                    del self.day_cache[ordinal]
+            self.chunks = [c for c in self.chunks
+                           if any(d.toordinal() in self.day_cache for d in c.dates)]
+        buckets = self.make_buckets(
+            datetime.date.fromordinal(min(missing)),
+            datetime.date.fromordinal(max(missing)),
+        )
+        self.chunks.append(buckets)
+        for date in buckets.dates.values():
+            self.day_cache.setdefault(date.id, date)
+
+    def patch_days(self, changed):
+        for buckets in self.chunks:
+            for d in buckets.update(changed):
+                ordinal = d.toordinal()
+                if ordinal in self.shown and self.day_cache.get(ordinal) is buckets.dates[d]:
+                    __, frame = self.shown[ordinal]
+                    kill_all_children(frame)
+                    self.fill_day_frame(frame, buckets.dates[d])
+
+    def refilter(self):
+        for buckets in self.chunks:
+            buckets.apply_filter()
+        for ordinal, (__, frame) in self.shown.items():
+            kill_all_children(frame)
+            self.fill_day_frame(frame, self.day_cache[ordinal])
+
+    def get_slot(self, date):
+        if self.free:
+            window_id, frame = self.free.pop()
+            kill_all_children(frame)
+        else:
+            frame = ttk.Frame(self.canvas)
+            window_id = self.canvas.create_window(0, 0, window=frame, anchor=tk.NW)
+        frame.configure(style=get_style_helper(date)('dateCell.TFrame'))
+        self.fill_day_frame(frame, date)
+        return window_id, frame
+
+
+class AgendaDisplay(TimelineDisplay):
+    """List of the next occurrences of all events, a page at a time
+
+    Pages are taken from one lazy merge of all events' occurrences, so
+    paging forward resumes it; pages already seen are kept for paging
+    back. Jumping to a date or changing events restarts the merge.
+    """
+    vertical = True
+
+    def __init__(self, parent, cur_day, events, add_event, edit_event):
+        super().__init__(parent, cur_day, events, add_event, edit_event)
+        self.page = 0
+        self.pages = []
+        self.stream = None
+
+    def move(self, offset):
+        self.page = max(0, self.page + offset)
+        if self._pending is not None:
+            self.frame.after_cancel(self._pending)
+        self._pending = self.frame.after(config.get('nav_delay'), self.show_page)
+
+    def display(self, day=None):
+        if day is not None:
+            self.cur_day = day
+            self.page = 0
+        if self.range_cb is not None:
+            self.range_cb(self.cur_day)
+        after = callib.force_tz(self.cur_day)
+        if self.event_filter is None:
+            self.stream = callib.merge_occurrences(self.events, after)
+        else:
+            # hidden series are not expanded, or an open-ended one would
+            # keep show_page looking for visible occurrences forever
+            f = self.event_filter
+            self.stream = callib.merge_occurrences(
+                [e for e in self.events if f.series_visible(e.uid) or f.overrides_visible(e)],
+                after, lambda e: f.series_visible(e.uid))
+        self.pages = []
+        self.show_page()
+
+    def refilter(self):
+        self.display()
+
+    def show_page(self):
+        """Render page ``self.page``, continuing the merge as far as needed"""
+        page_size = config.get('agenda_size')
+        time_format = config.get('time_format')
+        colors = config.get('tag_colors')
+        while len(self.pages) <= self.page:
+            page = []
+            for occ in self.stream:
+                info = make_event_info(occ, time_format, colors)
+                if self.event_filter is not None:
+                    info.categories, info.calendar = self.event_filter.masks_for(occ)
+                    if not self.event_filter.visible(info):
+                        continue
+                page.append(info)
+                if len(page) >= page_size:
+                    break
+            if not page and self.pages:
+                self.page = len(self.pages) - 1  # no more occurrences
+                break
+            self.pages.append(page)
+        super().display()
+
+    def get_dateinfos(self):
+        first = callib.force_tz(self.cur_day)
+        days = {}
+        for info in self.pages[self.page]:
+            d = max(info.event.start, first).date()
+            if d not in days:
+                days[d] = DateInfo(
+                    d.toordinal(),
+                    f'{d.day} {calendar.month_abbr[d.month]} {d.year}',
+                    config.get('days_of_week')[d.weekday()],
+                    False,
+                    d,
+                )
+            days[d].events.append(info)
+        return tuple(days.values())
+
+
+def pack_columns(intervals):
+    """Assign overlapping intervals to side-by-side columns
+
+    ``intervals`` are (start, end, payload) sorted by start. Returns
+    [start, end, payload, column, number of columns] for each. This is a
+    sweep colouring the interval graph with the lowest free column, which
+    needs the fewest columns possible; all intervals of a group of
+    transitively overlapping ones get that group's number of columns.
+    """
+    r = []
+    running = []  # (end, column)
+    free = []  # columns of the current group not in use
+    group = []
+    for start, end, payload in intervals:
+        while running and running[0][0] <= start:
+            heapq.heappush(free, heapq.heappop(running)[1])
+        if not running:
+            for item in group:
+                item[4] = len(free)
+            group = []
+            free = []
+        column = heapq.heappop(free) if free else len(running)
+        heapq.heappush(running, (end, column))
+        item = [start, end, payload, column, 0]
+        group.append(item)
+        r.append(item)
+    for item in group:
+        item[4] = len(running) + len(free)
+    return r
 
 
 def get_style_helper(date):
     return lambda name: ('grey.' if date.grey_out else '') + name
 
 
+def get_event_style(evt):
+    return ('conflict.' if evt.conflict else '') + f'{evt.color}.eventDisplay.'
+
+
+def get_event_padx(date, evt):
+    conf_padx = config.get('styles', 'eventDisplay', 'padx')
+    if isinstance(conf_padx, int):
+        conf_padx = (conf_padx, conf_padx)
+    return [c*(t == date.id) for c, t in zip(conf_padx, evt.times)]
+
+
+def truncate_text(font, text, width):
+    if font.measure(text) <= width:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if font.measure(text[:mid] + '…') <= width:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + '…' if low else ''
+
+
 def kill_all_children(widget):
     for child in tuple(widget.children.values()):
         child.destroy()
@@ -173,43 +786,198 @@ def date_range(start, end):
     return map(datetime.date.fromordinal, range(start.toordinal(), 1+end.toordinal()))
 
 
-def generate_dateinfos(events, start, end, extra_before=0, extra_after=0):
-    d1 = deltadays(1)
-    start_ = start - deltadays(extra_before)
-    end_ = end + deltadays(extra_after)
-    dates = {
-        d: DateInfo(
-            d.toordinal(),
-            str(d.day),
-            config.get('days_of_week')[d.weekday()],
-            not (start <= d <= end),
-            d,
-        ) for d in date_range(start_, end_)
-    }
-
-    # one day safety for timezone quirks (which probably won't actually happen)
-    q_start = datetime.datetime.combine((start_ - d1), datetime.time.min) \
-              .replace(tzinfo=dateutil.tz.UTC)
-    q_end = datetime.datetime.combine((end_ + d1), datetime.time.max) \
-            .replace(tzinfo=dateutil.tz.UTC)
-    time_format = config.get('time_format')
-    colors = config.get('tag_colors')
-    for evt in callib.filter_events(events, q_start, q_end):
-        info = EventInfo(
-            times=(evt.start, -evt.end.timestamp()),
-            summary=evt.summary,
-            time='All day' if evt.all_day else evt.start.strftime(time_format),
-            color=hex(hash(next((c for c in evt.categories if c in colors), ''))),
-            event=evt,
-        )
-        for d in date_range(evt.start, evt.end - datetime.timedelta.resolution):
-            try:
-                dates[d].events.append(info)
-            except KeyError:
-                pass
-            info = dataclasses.replace(info, time='cont.')
-
-    for date_info in dates.values():
-        date_info.events.sort(key=lambda e: e.times)
-
-    return tuple(dates.values())
+class EventFilter:
+    """Show or hide events by category and calendar
+
+    Every event gets a bitmask of its categories (one bit per category in
+    ``tag_colors``, one for all others) and of its calendar when it is
+    loaded or changed, so toggling is a bit test on expanded occurrences.
+    """
+    def __init__(self, events):
+        self.events = events  # ChainMap, one map per calendar
+        self.bits = {cat: 1 << i for i, cat in enumerate(filter(None, config.get('tag_colors')))}
+        self.other_bit = 1 << len(self.bits)
+        self.hidden_categories = 0
+        self.hidden_calendars = 0
+        self.masks = {}
+        for uid in events:
+            self.update(uid)
+
+    def category_mask(self, categories):
+        mask = 0
+        for cat in categories:
+            mask |= self.bits.get(cat, self.other_bit)
+        return mask or self.other_bit
+
+    def update(self, uid):
+        """Recompute the masks of ``uid`` after it changed"""
+        for i, m in enumerate(self.events.maps):
+            if uid in m:
+                self.masks[uid] = self.category_mask(m[uid].categories), 1 << i
+                return
+        self.masks.pop(uid, None)
+
+    def masks_for(self, occurrence):
+        categories, calendar = self.masks.get(occurrence.uid, (-1, 0))
+        if occurrence.override:
+            categories = self.category_mask(occurrence.categories)
+        return categories, calendar
+
+    def visible(self, info):
+        return bool(info.categories & ~self.hidden_categories
+                    and not info.calendar & self.hidden_calendars)
+
+    def series_visible(self, uid):
+        """Whether the occurrences of ``uid`` that are not overridden are shown"""
+        categories, calendar = self.masks.get(uid, (-1, 0))
+        return bool(categories & ~self.hidden_categories and not calendar & self.hidden_calendars)
+
+    def overrides_visible(self, event):
+        """Whether any override of ``event`` is shown"""
+        __, calendar = self.masks.get(event.uid, (-1, 0))
+        return not calendar & self.hidden_calendars and any(
+            self.category_mask(e.categories) & ~self.hidden_categories
+            for e in event.overrides.values())
+
+    def set_category(self, category, shown):
+        bit = self.bits.get(category, self.other_bit)
+        self.hidden_categories = self.hidden_categories & ~bit | (0 if shown else bit)
+
+    def set_calendar(self, index, shown):
+        bit = 1 << index
+        self.hidden_calendars = self.hidden_calendars & ~bit | (0 if shown else bit)
+
+
+class DayBuckets:
+    """EventInfos of a range of days, patchable one event at a time
+
+    Holds the DateInfos of the days from ``start - extra_before`` to
+    ``end + extra_after``. ``update`` re-expands only the changed events,
+    so editing does not cost an expansion of every event in view.
+    ``infos`` holds all EventInfos of a day, the DateInfo only those
+    shown by ``event_filter``.
+    """
+    def __init__(self, events, start, end, extra_before=0, extra_after=0, event_filter=None,
+                 query=None):
+        d1 = deltadays(1)
+        start_ = start - deltadays(extra_before)
+        end_ = end + deltadays(extra_after)
+        self.dates = {
+            d: DateInfo(
+                d.toordinal(),
+                str(d.day),
+                config.get('days_of_week')[d.weekday()],
+                not (start <= d <= end),
+                d,
+            ) for d in date_range(start_, end_)
+        }
+        self.infos = {d: [] for d in self.dates}
+        self.days_of = collections.defaultdict(set)  # uid -> dates showing it
+        self.event_filter = event_filter
+
+        # one day safety for timezone quirks (which probably won't actually happen)
+        self.q_start = datetime.datetime.combine((start_ - d1), datetime.time.min) \
+                       .replace(tzinfo=dateutil.tz.UTC)
+        self.q_end = datetime.datetime.combine((end_ + d1), datetime.time.max) \
+                     .replace(tzinfo=dateutil.tz.UTC)
+        if query is None:
+            occurrences = callib.sorted_occurrences(events, self.q_start, self.q_end)
+        else:
+            occurrences = list(query(self.q_start, self.q_end))
+        conflicts = set()
+        if config.get('show_conflicts'):
+            for pair in callib.find_conflicts(occurrences):
+                conflicts.update(map(id, pair))
+        self.add(occurrences, conflicts)
+        for infos in self.infos.values():
+            infos.sort(key=lambda e: e.times)
+        self.apply_filter()
+
+    def add(self, occurrences, conflicts):
+        """Put ``occurrences`` into their days unsorted, return these days"""
+        time_format = config.get('time_format')
+        colors = config.get('tag_colors')
+        touched = set()
+        for evt in occurrences:
+            info = make_event_info(evt, time_format, colors, id(evt) in conflicts)
+            if self.event_filter is not None:
+                info.categories, info.calendar = self.event_filter.masks_for(evt)
+            for d in date_range(evt.start, evt.end - datetime.timedelta.resolution):
+                if d in self.dates:
+                    self.infos[d].append(info)
+                    self.days_of[evt.uid].add(d)
+                    touched.add(d)
+                info = dataclasses.replace(info, time='cont.')
+        return touched
+
+    def days_spanned(self, occurrence):
+        return [d for d in date_range(occurrence.start, occurrence.end - datetime.timedelta.resolution)
+                if d in self.dates]
+
+    def update(self, changed):
+        """Replace the occurrences of the events in ``changed``
+
+        ``changed`` maps UIDs to the new Event, or None if it was deleted.
+        Returns the dates whose DateInfo changed.
+        """
+        touched = set()
+        for uid in changed:
+            for d in self.days_of.pop(uid, ()):
+                self.infos[d][:] = (e for e in self.infos[d] if e.event.uid != uid)
+                touched.add(d)
+        new = [evt for evt in changed.values() if evt is not None]
+        touched |= self.add(callib.filter_events(new, self.q_start, self.q_end), ())
+        if config.get('show_conflicts'):
+            touched |= self.recheck_conflicts(touched)
+        for d in touched:
+            self.infos[d].sort(key=lambda e: e.times)
+        self.apply_filter(touched)
+        return touched
+
+    def apply_filter(self, dates=None):
+        """Set the shown events of ``dates`` (default: all) from ``infos``"""
+        for d in self.dates if dates is None else dates:
+            if self.event_filter is None:
+                self.dates[d].events = list(self.infos[d])
+            else:
+                self.dates[d].events = list(filter(self.event_filter.visible, self.infos[d]))
+
+    def recheck_conflicts(self, dates):
+        """Recompute conflicts of the occurrences on ``dates``, return changed dates
+
+        Overlapping occurrences share a day, so looking at all days spanned
+        by those occurrences is enough.
+        """
+        occurrences = {id(i.event): i.event for d in dates for i in self.infos[d]}
+        around = set(dates)
+        for occ in occurrences.values():
+            around.update(self.days_spanned(occ))
+        candidates = {id(i.event): i.event for d in around for i in self.infos[d]}
+        conflicts = set()
+        for pair in callib.find_conflicts(
+                sorted(candidates.values(), key=lambda o: o.start.timestamp())):
+            conflicts.update(map(id, pair))
+        changed = set()
+        for d in around:
+            for info in self.infos[d]:
+                conflict = id(info.event) in conflicts
+                if id(info.event) in occurrences and info.conflict != conflict:
+                    info.conflict = conflict
+                    changed.add(d)
+        return changed
+
+
+def make_event_info(occurrence, time_format, colors, conflict=False):
+    return EventInfo(
+        times=(occurrence.start, -occurrence.end.timestamp()),
+        summary=occurrence.summary,
+        time='All day' if occurrence.all_day else occurrence.start.strftime(time_format),
+        color=hex(hash(next((c for c in occurrence.categories if c in colors), ''))),
+        event=occurrence,
+        conflict=conflict,
+    )
+
+
+def generate_dateinfos(events, start, end, extra_before=0, extra_after=0, event_filter=None):
+    return tuple(DayBuckets(
+        events, start, end, extra_before, extra_after, event_filter).dates.values())
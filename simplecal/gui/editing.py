@@ -6,6 +6,7 @@ import dataclasses
 from functools import partial
 import logging
 import uuid
+import dateutil.tz
 from .. import config
 from .. import callib
 
@@ -51,6 +52,10 @@ class DatetimeInput:
             w.pack(side=tk.LEFT)
         frame.pack()
 
+    def clear(self):
+        for var in (self.dvar, self.hvar, self.mvar):
+            var.set('')
+
     def set(self, value):
         if isinstance(value, datetime.datetime):
             self.hvar.set(str(value.hour))
@@ -161,6 +166,15 @@ class RRuleInput:
 
         self.end_var.set('indef')
 
+    def reset(self):
+        self._rule = None
+        self.repeat_var.set(0)
+        self.interval_var.set('1')
+        self.freq_var.set('weekly')
+        self.count_var.set('')
+        self.until.clear()
+        self.end_var.set('indef')
+
     def set_states(self):
         def for_all_children(w):
             if isinstance(w, (ttk.Entry, ttk.Radiobutton)):
@@ -213,7 +227,8 @@ class RRuleInput:
 
 
 class EventPopup:
-    def __init__(self, root, callback, categories):
+    """Event editor, built once and reused for every add/edit"""
+    def __init__(self, root, callback):
         self.callback = callback
         self.title_var = tk.StringVar(root)
         self.summary_var = tk.StringVar(root)
@@ -222,11 +237,12 @@ class EventPopup:
         self.allday_var = tk.IntVar(root)
         self.end_var = tk.IntVar(root)
         self.uid = str(uuid.uuid4())
+        self.alarms = []
 
         self.toplevel = toplevel = tk.Toplevel(root)
+        toplevel.withdraw()
         toplevel.transient(root)
-        toplevel.wait_visibility()
-        toplevel.grab_set()
+        toplevel.protocol('WM_DELETE_WINDOW', self.hide)
 
         ttk.Label(toplevel, textvariable=self.title_var).pack()
         self._add_labeled_entry('Summary: ', self.summary_var)
@@ -248,21 +264,20 @@ class EventPopup:
         self.rrule = RRuleInput(tk.Frame(toplevel), self.start, self.allday_var)
         self.allday_var.set(0)
 
-        self.categories = categories
+        self.categories = []
         self.cat_lb = tk.Listbox(
             self.toplevel,
-            height=len(self.categories),
+            height=0,
             selectmode='multiple',
             exportselection=False,
         )
-        self.cat_lb.insert(0, *self.categories)
         self.cat_lb.pack()
         self._add_labeled_entry('Description: ', self.description_var)
         self._add_labeled_entry('Location: ', self.location_var)
 
         btnframe = tk.Frame(toplevel)
         ttk.Button(btnframe, text='OK', command=self.on_ok).pack(side=tk.LEFT)
-        ttk.Button(btnframe, text='Cancel', command=toplevel.destroy).pack(side=tk.RIGHT)
+        ttk.Button(btnframe, text='Cancel', command=self.hide).pack(side=tk.RIGHT)
         btnframe.pack(side=tk.BOTTOM, fill=tk.X, expand=True)
 
     def _add_labeled_entry(self, label, var):
@@ -271,6 +286,39 @@ class EventPopup:
         ttk.Entry(frame, textvariable=var).pack(side=tk.LEFT)
         frame.pack()
 
+    def set_categories(self, categories):
+        """Update the category list, only touching entries that changed"""
+        self.cat_lb.selection_clear(0, tk.END)
+        for i in reversed(range(len(self.categories))):
+            if self.categories[i] not in categories:
+                self.cat_lb.delete(i)
+                del self.categories[i]
+        new = [c for c in categories if c not in self.categories]
+        self.cat_lb.insert(tk.END, *new)
+        self.categories.extend(new)
+        self.cat_lb.config(height=len(self.categories))
+
+    def open(self, title, categories):
+        """Reset all inputs and show the popup"""
+        self.title_var.set(title)
+        for var in (self.summary_var, self.description_var, self.location_var):
+            var.set('')
+        self.allday_var.set(0)
+        self.end_var.set(0)
+        self.start.clear()
+        self.end.clear()
+        self.rrule.reset()
+        self.set_categories(categories)
+        self.uid = str(uuid.uuid4())
+        self.alarms = []
+        self.toplevel.deiconify()
+        self.toplevel.wait_visibility()
+        self.toplevel.grab_set()
+
+    def hide(self):
+        self.toplevel.grab_release()
+        self.toplevel.withdraw()
+
     def on_ok(self):
         try:
             start = self.start.get()
@@ -287,40 +335,39 @@ class EventPopup:
             [self.categories[i] for i in self.cat_lb.curselection()],
             self.rrule.get(),
             self.uid,
+            alarms=self.alarms,
         ))
-        self.toplevel.destroy()
+        self.hide()
 
 
 def get_handlers(root, update_cb, delete_cb):
     if update_cb is delete_cb is None:
         return lambda _: None, lambda *_: None
-    return (partial(add_event, root, update_cb),
-            partial(edit_event_menu, root, update_cb, delete_cb))
+    popup = EventPopup(root, update_cb)
+    return (partial(add_event, popup),
+            partial(edit_event_menu, root, popup, update_cb, delete_cb))
 
 
-def add_event(root, callback, date):
-    cats = tuple(filter(None, config.get('tag_colors')))
-    popup = EventPopup(root, callback, cats)
-    popup.title_var.set('New Event')
+def add_event(popup, date):
+    popup.open('New Event', tuple(filter(None, config.get('tag_colors'))))
     popup.start.set(date)
 
 
-def edit_event_menu(root, update_cb, delete_cb, event, tk_evt):
+def edit_event_menu(root, popup, update_cb, delete_cb, event, tk_evt):
     menu = tk.Menu(root)
-    cmd = partial(real_edit_event, root, update_cb, event.original)
+    cmd = partial(real_edit_event, popup, event.original)
     menu.add_command(label='Edit', command=cmd)
     menu.add_command(label='Delete', command=partial(delete_cb, event))
-    if event.original != event:
+    if not event.override and (event.rrule.rules or event.rrule.inc_dates):
         new_rule = event.rrule.with_ex(event.orig_start(tz=True))
         excl = dataclasses.replace(event.original, rrule=new_rule)
         menu.add_command(label='Exclude', command=partial(update_cb, excl))
     menu.post(tk_evt.x_root, tk_evt.y_root)
 
 
-def real_edit_event(root, callback, event):
+def real_edit_event(popup, event):
     cats = tuple({*filter(None, config.get('tag_colors')), *event.categories})
-    popup = EventPopup(root, callback, cats)
-    popup.title_var.set('Edit Event')
+    popup.open('Edit Event', cats)
     popup.allday_var.set(event.all_day)
     popup.end_var.set(
         event.duration != (datetime.timedelta(days=1) if event.all_day else datetime.timedelta())
@@ -331,6 +378,105 @@ def real_edit_event(root, callback, event):
     popup.description_var.set(event.description)
     popup.location_var.set(event.location)
     for cat in event.categories:
-        popup.cat_lb.selection_set(cats.index(cat))
+        popup.cat_lb.selection_set(popup.categories.index(cat))
     popup.rrule.set(event.rrule)
     popup.uid = event.uid
+    popup.alarms = event.alarms
+
+
+class BulkEditPopup:
+    """Apply one change to all events matching a query, as one batch"""
+    def __init__(self, root, events, index, callback):
+        self.events = events
+        self.index = index
+        self.callback = callback
+        self.query_var = tk.StringVar(root)
+        self.before_var = tk.StringVar(root)
+        self.action_var = tk.StringVar(root, 'categories')
+        self.hours_var = tk.StringVar(root, '1')
+        self.count_var = tk.StringVar(root)
+
+        self.toplevel = toplevel = tk.Toplevel(root)
+        toplevel.transient(root)
+        toplevel.title('Bulk edit')
+        self._add_labeled_entry('Events matching: ', self.query_var)
+        self._add_labeled_entry('Ending before: ', self.before_var)
+        ttk.Label(toplevel, textvariable=self.count_var).pack()
+        for var in (self.query_var, self.before_var):
+            var.trace_add('write', lambda *_: self.update_count())
+
+        ttk.Radiobutton(
+            toplevel,
+            text='Set categories',
+            variable=self.action_var,
+            value='categories',
+        ).pack(anchor=tk.W)
+        self.categories = tuple(filter(None, config.get('tag_colors')))
+        self.cat_lb = tk.Listbox(
+            toplevel,
+            height=len(self.categories),
+            selectmode='multiple',
+            exportselection=False,
+        )
+        self.cat_lb.insert(0, *self.categories)
+        self.cat_lb.pack()
+        shiftrow = tk.Frame(toplevel)
+        ttk.Radiobutton(
+            shiftrow,
+            text='Shift by ',
+            variable=self.action_var,
+            value='shift',
+        ).pack(side=tk.LEFT)
+        ttk.Entry(shiftrow, width=4, textvariable=self.hours_var).pack(side=tk.LEFT)
+        ttk.Label(shiftrow, text=' hours').pack(side=tk.LEFT)
+        shiftrow.pack(anchor=tk.W)
+        ttk.Radiobutton(
+            toplevel,
+            text='Delete',
+            variable=self.action_var,
+            value='delete',
+        ).pack(anchor=tk.W)
+
+        btnframe = tk.Frame(toplevel)
+        ttk.Button(btnframe, text='OK', command=self.on_ok).pack(side=tk.LEFT)
+        ttk.Button(btnframe, text='Cancel', command=toplevel.destroy).pack(side=tk.RIGHT)
+        btnframe.pack(side=tk.BOTTOM, fill=tk.X, expand=True)
+        self.update_count()
+
+    _add_labeled_entry = EventPopup._add_labeled_entry
+
+    def matching(self):
+        query = self.query_var.get()
+        uids = self.index.search(query) if query.strip() else set(self.events)
+        matches = [self.events[uid] for uid in uids if uid in self.events]
+        if before := self.before_var.get().strip():
+            cutoff = callib.force_tz(datetime.date.fromisoformat(before))
+            matches = [e for e in matches
+                       if (end := callib.last_end(e)) is not None and end <= cutoff]
+        return matches
+
+    def update_count(self):
+        try:
+            self.count_var.set(f'{len(self.matching())} matching events')
+        except ValueError:
+            self.count_var.set('invalid date')
+
+    def on_ok(self):
+        try:
+            matches = self.matching()
+            hours = float(self.hours_var.get())
+        except ValueError as e:
+            tk_msg.showerror('error', e)
+            return
+        action = self.action_var.get()
+        if action == 'delete':
+            self.callback((), [e.uid for e in matches])
+        elif action == 'shift':
+            delta = datetime.timedelta(hours=hours)
+            self.callback([callib.shift_event(e, delta) for e in matches], ())
+        else:
+            cats = [self.categories[i] for i in self.cat_lb.curselection()]
+            now = datetime.datetime.now(dateutil.tz.UTC)
+            self.callback([dataclasses.replace(e, categories=cats, mod_stamp=now)
+                           for e in matches], ())
+        self.toplevel.destroy()
@@ -0,0 +1,47 @@
+"""memory instrumentation GUI"""
+import tkinter as tk
+from tkinter import ttk
+import tkinter.filedialog as tk_fdia
+import logging
+from .. import memory
+
+
+def display_memory_popup(root, tracker):
+    toplevel = tk.Toplevel(root)
+    toplevel.title('Memory')
+    frame = ttk.Frame(toplevel)
+    text = tk.Text(frame, width=110, height=40, font='TkFixedFont', wrap=tk.NONE)
+    scrollbar = ttk.Scrollbar(frame, command=text.yview)
+    text['yscrollcommand'] = scrollbar.set
+    text.pack(expand=True, fill=tk.BOTH, side=tk.LEFT)
+    scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
+    frame.pack(expand=True, fill=tk.BOTH)
+
+    def show():
+        text.configure(state=tk.NORMAL)
+        text.delete('1.0', tk.END)
+        text.insert('1.0', tracker.text())
+        text.configure(state=tk.DISABLED)
+
+    def snapshot():
+        memory.start()
+        tracker.snapshot('manual')
+        show()
+
+    def save():
+        path = tk_fdia.asksaveasfilename(
+            parent=toplevel, defaultextension='.txt', initialfile='simplecal-memory.txt')
+        if not path:
+            return
+        try:
+            tracker.dump(path)
+        except OSError as e:
+            logging.error(str(e))
+        show()
+
+    buttons = ttk.Frame(toplevel)
+    ttk.Button(buttons, text='Snapshot', command=snapshot).pack(side=tk.LEFT)
+    ttk.Button(buttons, text='Save…', command=save).pack(side=tk.LEFT)
+    ttk.Button(buttons, text='Close', command=toplevel.destroy).pack(side=tk.RIGHT)
+    buttons.pack(fill=tk.X)
+    show()
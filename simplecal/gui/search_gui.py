@@ -0,0 +1,54 @@
+"""Search GUI"""
+import tkinter as tk
+from tkinter import ttk
+from .. import config
+from .. import search
+
+MAX_RESULTS = 200
+SEARCH_DELAY = 150  # ms after the last keystroke
+
+
+def display_search_popup(root, dis, index, events):
+    toplevel = tk.Toplevel(root)
+    toplevel.transient(root)
+    toplevel.title('Search')
+    query_var = tk.StringVar(toplevel)
+    entry = ttk.Entry(toplevel, textvariable=query_var)
+    entry.pack(fill=tk.X)
+    frame = ttk.Frame(toplevel)
+    listbox = tk.Listbox(frame, width=60, font='TkFixedFont')
+    scrollbar = ttk.Scrollbar(frame, command=listbox.yview)
+    listbox['yscrollcommand'] = scrollbar.set
+    listbox.pack(expand=True, fill=tk.BOTH, side=tk.LEFT)
+    scrollbar.pack(fill=tk.Y, side=tk.RIGHT)
+    frame.pack(expand=True, fill=tk.BOTH)
+    results = []
+    pending = []
+
+    def schedule(*_):
+        if pending:
+            toplevel.after_cancel(pending.pop())
+        pending.append(toplevel.after(SEARCH_DELAY, update))
+
+    def update():
+        pending.clear()
+        results[:] = index.results(query_var.get(), events, limit=MAX_RESULTS)
+        time_format = config.get('time_format')
+        listbox.delete(0, tk.END)
+        listbox.insert(0, *(search.format_result(e, o, time_format) for e, o in results))
+
+    def jump(_=None):
+        if pending:
+            toplevel.after_cancel(pending[0])
+            update()
+        selection = listbox.curselection() or (0,)
+        if selection[0] >= len(results):
+            return
+        event, occurrence = results[selection[0]]
+        dis.display((occurrence or event).start.date())
+
+    query_var.trace_add('write', schedule)
+    entry.bind('<Return>', jump)
+    listbox.bind('<Double-1>', jump)
+    listbox.bind('<Return>', jump)
+    entry.focus_set()
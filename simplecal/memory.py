@@ -0,0 +1,191 @@
+"""opt-in memory instrumentation based on tracemalloc"""
+import collections
+import dataclasses
+import datetime
+import gc
+import os
+import sys
+import tracemalloc
+import types
+from . import storage
+
+FRAMES = 10
+HISTORY = 20
+LIMIT = 15
+# innermost known frame decides the subsystem of an allocation
+SUBSYSTEMS = (
+    (os.path.join('simplecal', 'gui', ''), 'gui'),
+    (os.path.join('simplecal', ''), None),  # named after the module
+    (os.path.join('icalendar', ''), 'icalendar'),
+    (os.path.join('dateutil', ''), 'dateutil'),
+    (os.path.join('tkinter', ''), 'tkinter'),
+)
+SKIP_TYPES = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+IGNORE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(FRAMES)
+
+
+def subsystem(traceback):
+    for frame in reversed(traceback):
+        for part, name in SUBSYSTEMS:
+            i = frame.filename.rfind(part)
+            if i >= 0:
+                return name or os.path.splitext(frame.filename[i+len(part):])[0]
+    return 'other'
+
+
+def deep_size(obj):
+    """Return the size of ``obj`` and everything reachable from it
+
+    Classes, modules and functions are not followed.
+    """
+    seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, SKIP_TYPES):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        stack.extend(gc.get_referents(o))
+    return size
+
+
+def loaded_events(events):
+    """Return the events already in memory, without parsing or waiting for more"""
+    if isinstance(events, storage.SQLiteEvents):
+        return list(events.parsed.values())
+    if isinstance(events, storage.DirEvents):
+        return list((events._data or {}).values())
+    return list(events.values())
+
+
+def calendar_sizes(cal):
+    """Return (whole calendar, rrule window caches) in bytes"""
+    windows = 0
+    for evt in loaded_events(cal.events):
+        for e in (evt, *evt.overrides.values()):
+            windows += deep_size(e.rrule._windows)
+    return deep_size(cal), windows
+
+
+def count_widgets(widget):
+    return 1 + sum(map(count_widgets, widget.winfo_children()))
+
+
+@dataclasses.dataclass
+class Report:
+    label: str
+    time: datetime.datetime
+    snapshot: tracemalloc.Snapshot
+    traced: tuple[int, int]  # current, peak
+    calendars: dict[str, tuple[int, int]]
+    widgets: int = None
+
+    def by_subsystem(self):
+        r = collections.Counter()
+        for trace in self.snapshot.traces:
+            r[subsystem(trace.traceback)] += trace.size
+        return r
+
+
+class MemoryTracker:
+    """Take labelled memory snapshots and report growth between them
+
+    Snapshots are only taken while tracemalloc is tracing, see ``start``.
+    """
+    def __init__(self, calendars, root=None):
+        self.calendars = calendars
+        self.root = root
+        self.first = None
+        self.reports = collections.deque(maxlen=HISTORY)
+
+    def snapshot(self, label):
+        if not tracemalloc.is_tracing():
+            return None
+        report = Report(
+            label,
+            datetime.datetime.now(),
+            tracemalloc.take_snapshot().filter_traces(IGNORE),
+            tracemalloc.get_traced_memory(),
+            {cal.file: calendar_sizes(cal) for cal in self.calendars},
+            None if self.root is None else count_widgets(self.root),
+        )
+        if self.first is None:
+            self.first = report
+        self.reports.append(report)
+        return report
+
+    def text(self, limit=LIMIT):
+        """Format the latest snapshot, compared to the one before"""
+        if not self.reports:
+            return 'No snapshots, memory tracing is off.'
+        previous = self.reports[-2] if len(self.reports) > 1 else None
+        parts = [format_report(self.reports[-1], previous, limit)]
+        if self.first is not previous and self.first is not self.reports[-1]:
+            parts.append(format_diff(self.first, self.reports[-1], limit))
+        return '\n\n'.join(parts)
+
+    def dump(self, path, limit=LIMIT):
+        """Write a final snapshot and the growth between all kept ones to ``path``"""
+        self.snapshot('exit')
+        reports = list(self.reports)
+        with open(path, 'w') as f:
+            if not reports:
+                f.write(self.text(limit) + '\n')
+                return
+            f.write(format_report(reports[-1], None, limit) + '\n')
+            for old, new in zip([self.first, *reports], reports):
+                if old is new:
+                    continue
+                f.write('\n' + format_diff(old, new, limit) + '\n')
+
+
+def format_size(size):
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+
+
+def format_report(report, previous=None, limit=LIMIT):
+    lines = [
+        f'{report.label} at {report.time:%H:%M:%S}: '
+        f'{format_size(report.traced[0])} traced, peak {format_size(report.traced[1])}',
+    ]
+    if report.widgets is not None:
+        lines.append(f'Tk widgets: {report.widgets}')
+    lines.append('Calendars (reachable size, of which rrule caches):')
+    for name, (total, windows) in report.calendars.items():
+        lines.append(f'  {format_size(total):>11} {format_size(windows):>11}  {name}')
+    lines.append('Subsystems:')
+    old = previous.by_subsystem() if previous else collections.Counter()
+    for name, size in report.by_subsystem().most_common():
+        diff = f' ({size - old[name]:+d} B)' if previous else ''
+        lines.append(f'  {format_size(size):>11}  {name}{diff}')
+    if previous is not None:
+        lines.append(format_diff(previous, report, limit, header=False))
+    else:
+        lines.append('Top allocation sites:')
+        for stat in report.snapshot.statistics('lineno')[:limit]:
+            lines.append(f'  {stat}')
+    return '\n'.join(lines)
+
+
+def format_diff(old, new, limit=LIMIT, header=True):
+    lines = [f'Growth from "{old.label}" to "{new.label}":'] if header else ['Growth by allocation site:']
+    for stat in new.snapshot.compare_to(old.snapshot, 'lineno')[:limit]:
+        lines.append(f'  {stat}')
+    return '\n'.join(lines)
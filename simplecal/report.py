@@ -0,0 +1,67 @@
+"""occurrence expansion and reports over long ranges"""
+import collections
+import concurrent.futures
+import datetime
+import heapq
+import itertools
+import os
+from . import callib
+
+CHUNKS_PER_PROCESS = 4
+
+
+def expand_chunk(events, start, end):
+    """Expand ``events`` like filter_events, as picklable sorted tuples
+
+    Tuples are (start timestamp, index in ``events``, start, end,
+    recurrence id or None). Sorting uses timestamps because comparing
+    datetimes with different tzinfo objects is slow.
+    """
+    r = []
+    for i, evt in enumerate(events):
+        rids = {id(e): dt for dt, e in evt.overrides.items()}
+        for occ in callib.filter_events((evt,), start, end):
+            r.append((occ.start.timestamp(), i, occ.start, occ.end, rids.get(id(occ.event))))
+    r.sort(key=lambda t: t[:2])
+    return r
+
+
+def expand(events, start, end, processes=None):
+    """Yield occurrences of ``events`` between ``start`` and ``end`` in time order
+
+    The events are split into chunks that are expanded in a process pool
+    and merged back into one sorted stream. The occurrences are the same
+    as those of ``filter_events``.
+    """
+    events = list(events)
+    processes = processes or os.cpu_count() or 1
+    n_chunks = min(len(events), processes * CHUNKS_PER_PROCESS) or 1
+    chunks = [events[i::n_chunks] for i in range(n_chunks)]
+    if processes == 1:
+        results = [expand_chunk(chunk, start, end) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(
+                expand_chunk, chunks, [start] * n_chunks, [end] * n_chunks))
+    merged = heapq.merge(*(
+        zip(itertools.repeat(n), result) for n, result in enumerate(results)
+    ), key=lambda t: (t[1][0], t[0], t[1][1]))
+    for n, (__, i, o_start, o_end, rid) in merged:
+        evt = chunks[n][i]
+        if rid is None:
+            yield callib.Occurrence(evt, o_start, o_end)
+        else:
+            yield callib.Occurrence(evt.overrides[rid], o_start, o_end, True)
+
+
+def category_usage(occurrences):
+    """Return {category: [number of occurrences, total duration]}
+
+    Occurrences without categories are counted under ``''``.
+    """
+    r = collections.defaultdict(lambda: [0, datetime.timedelta()])
+    for occ in occurrences:
+        for cat in occ.categories or ['']:
+            r[str(cat)][0] += 1
+            r[str(cat)][1] += occ.duration
+    return dict(r)
@@ -0,0 +1,116 @@
+"""full-text search over events"""
+import bisect
+import collections
+import datetime
+import heapq
+import re
+import dateutil.tz
+from . import callib
+
+FIELDS = ('summary', 'description', 'location', 'categories')
+token_re = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return token_re.findall(text.casefold())
+
+
+def event_tokens(event):
+    tokens = set()
+    for evt in (event, *event.overrides.values()):
+        for field in FIELDS:
+            value = getattr(evt, field)
+            if isinstance(value, list):
+                value = ' '.join(map(str, value))
+            tokens.update(tokenize(value))
+    return tokens
+
+
+class SearchIndex:
+    """Inverted index from words to event UIDs
+
+    The index is updated incrementally with ``add`` and ``remove``.
+    Every query word matches as a prefix, so partial input works.
+    """
+    def __init__(self, events=()):
+        self.postings = collections.defaultdict(set)
+        self.by_uid = {}
+        self._sorted = []
+        for event in events:
+            self.add(event)
+
+    def add(self, event):
+        self.remove(event.uid)
+        tokens = self.by_uid[event.uid] = event_tokens(event)
+        for token in tokens:
+            if token not in self.postings:
+                self._sorted = None
+            self.postings[token].add(event.uid)
+
+    def remove(self, uid):
+        for token in self.by_uid.pop(uid, ()):
+            uids = self.postings[token]
+            uids.discard(uid)
+            if not uids:
+                del self.postings[token]
+                self._sorted = None
+
+    def prefix_matches(self, prefix):
+        if self._sorted is None:
+            self._sorted = sorted(self.postings)
+        uids = set()
+        i = bisect.bisect_left(self._sorted, prefix)
+        while i < len(self._sorted) and self._sorted[i].startswith(prefix):
+            uids |= self.postings[self._sorted[i]]
+            i += 1
+        return uids
+
+    def search(self, query):
+        """Return the set of UIDs of events matching all words in ``query``"""
+        words = tokenize(query)
+        if not words:
+            return set()
+        result = self.prefix_matches(words[0])
+        for word in words[1:]:
+            if not result:
+                break
+            result &= self.prefix_matches(word)
+        return result
+
+    def results(self, query, events, after=None, limit=None):
+        """Return (event, next occurrence or None) pairs for ``query``
+
+        Events are looked up by UID in ``events``. Results are sorted by
+        next occurrence, events without upcoming occurrences last. With
+        ``limit``, only the first that many are returned, and events that
+        ended before ``after`` are not expanded, so short prefixes do not
+        expand every past event; those that ended last fill up the rest.
+        """
+        if after is None:
+            after = datetime.datetime.now(dateutil.tz.UTC)
+        far = datetime.datetime.max.replace(tzinfo=dateutil.tz.UTC)
+
+        def key(x):
+            return x[1] is None, far if x[1] is None else x[1].start
+
+        matches = [events[uid] for uid in self.search(query) if uid in events]
+        if limit is None or len(matches) <= limit:
+            return sorted(((evt, callib.next_occurrence(evt, after)) for evt in matches), key=key)
+        upcoming, past = [], []
+        for evt in matches:
+            end = callib.last_end(evt)
+            (past if end is not None and end < after else upcoming).append(evt)
+        r = heapq.nsmallest(
+            limit, ((evt, callib.next_occurrence(evt, after)) for evt in upcoming), key=key)
+        r += ((evt, None) for evt in heapq.nlargest(
+            limit - len(r), past, key=lambda e: e.start.timestamp()))
+        return r
+
+
+def format_result(event, occurrence, time_format='%H:%M'):
+    if occurrence is None:
+        return f'{"(past)":<16} {event.summary}'
+    when = occurrence.start.strftime('%Y-%m-%d')
+    if not occurrence.all_day:
+        when += ' ' + occurrence.start.strftime(time_format)
+    return f'{when:<16} {occurrence.summary}'
@@ -0,0 +1,599 @@
+"""calendar storage backends besides single .ics files"""
+import collections.abc
+import concurrent.futures
+import contextlib
+import dataclasses
+import datetime
+import itertools
+import logging
+import os
+import sqlite3
+import urllib.parse
+import icalendar
+import dateutil.tz
+from . import caldav
+from . import callib
+from . import config
+from . import subscribe
+
+LOAD_THREADS = 8
+SQLITE_SUFFIXES = ('.sqlite', '.sqlite3', '.db')
+ICS_SUFFIXES = ('.ics', '.ics.gz', '.ics.bz2', '.ics.xz')
+
+
+def open_calendar(path):
+    """Open ``path`` with the matching storage backend"""
+    if path.startswith(caldav.URL_PREFIXES):
+        return caldav.CalDAVCalendar(path)
+    if path.startswith(subscribe.URL_PREFIXES):
+        return subscribe.RemoteCalendar(path)
+    if os.path.isdir(path):
+        return DirCalendar(path)
+    if path.endswith(SQLITE_SUFFIXES):
+        return SQLiteCalendar(path)
+    if config.get('archive_months'):
+        return ArchivingCalendar(path, config.get('archive_months'))
+    return callib.Calendar(path)
+
+
+def new_ical():
+    r = icalendar.Calendar()
+    r.add('prodid', '-//simplecal//simplecal//EN')
+    r.add('version', '2.0')
+    return r
+
+
+def write_ics(events, path, other_comps=()):
+    """Write ``events`` (with overrides) to a single new .ics file, compressed by its suffix"""
+    events = list(events)
+    comps = itertools.chain(
+        callib.with_vtimezones(events, other_comps),
+        itertools.chain.from_iterable(evt.to_components() for evt in events),
+    )
+    with callib.opener_for(path)(path, 'wb') as f:
+        for chunk in callib.iter_ical(new_ical(), comps):
+            f.write(chunk)
+
+
+def convert(source, target):
+    """Copy all events from ``source`` to ``target``
+
+    A target ending in .ics (optionally .gz, .bz2 or .xz) is written as
+    a single file, one ending in .sqlite, .sqlite3 or .db is an SQLite
+    database, and anything else is used as a calendar directory.
+    """
+    source_cal = open_calendar(source)
+    if isinstance(source_cal, subscribe.RemoteCalendar):
+        source_cal.wait_loaded()
+    load_archives((source_cal,))
+    if target.endswith(ICS_SUFFIXES):
+        if isinstance(source_cal, SQLiteCalendar):
+            source_cal.export(target)
+        else:
+            write_ics(source_cal.events.values(), target, getattr(source_cal, 'other_comps', ()))
+        return
+    if not target.endswith(SQLITE_SUFFIXES):
+        os.makedirs(target, exist_ok=True)
+    cal = open_calendar(target)
+    cal.apply(source_cal.events.values())
+    cal.write()
+
+
+def iter_vevents(path):
+    """Yield (UID, RECURRENCE-ID or None, Event) for each VEVENT of the .ics file ``path``"""
+    for comp in callib.iter_file_components(path):
+        if comp.name != 'VEVENT':
+            continue
+        rid = comp.get('recurrence-id')
+        if rid is not None and 'range' in rid.params:
+            logging.warning(f'cannot process RANGE param in event with RECURRENCE-ID, skipping')
+            continue
+        try:
+            evt = callib.Event.from_vevent(comp)
+        except (KeyError, ValueError) as e:
+            logging.warning(f'Skipping invalid event in "{path}": {e!r}')
+            continue
+        yield evt.uid, None if rid is None else callib.force_tz(rid.dt), evt
+
+
+def newer(new, old):
+    return callib.force_tz(new.mod_stamp) > callib.force_tz(old.mod_stamp)
+
+
+def import_ics(cal, paths):
+    """Merge the events of the .ics files ``paths`` into ``cal``, then write it once
+
+    Files are streamed one VEVENT at a time. Of events with the same UID,
+    and overrides with the same UID and RECURRENCE-ID, the one with the
+    latest DTSTAMP is kept; on ties, the one read first. A newer event
+    keeps the overrides of the one it replaces. Returns a Counter of
+    added, updated and unchanged events and overrides.
+    """
+    load_archives((cal,))
+    stats = collections.Counter()
+    events = cal.events
+    # SQLite can hold more events than memory, only keep those changed in place
+    cached = events.parsed if isinstance(events, SQLiteEvents) else {}
+    own = set()  # UIDs of events created here, whose overrides can be changed in place
+    touched = set()  # of those, the ones changed after being stored
+    orphans = {}  # overrides read before their event
+
+    def add_override(uid, rid, evt):
+        master = events[uid]
+        old = master.overrides.get(rid)
+        if old is not None and not newer(evt, old):
+            stats['unchanged'] += 1
+            if uid not in own:
+                cached.pop(uid, None)
+            return
+        stats['added' if old is None else 'updated'] += 1
+        if uid in own:
+            master.overrides[rid] = evt
+            touched.add(uid)
+        else:
+            events[uid] = dataclasses.replace(master, overrides={**master.overrides, rid: evt})
+            own.add(uid)
+
+    with cal.batch():
+        for path in paths:
+            for uid, rid, evt in iter_vevents(path):
+                if rid is not None:
+                    if uid in events:
+                        add_override(uid, rid, evt)
+                    elif (uid, rid) not in orphans or newer(evt, orphans[uid, rid]):
+                        orphans[uid, rid] = evt
+                    continue
+                old = events.get(uid)
+                if old is not None:
+                    if not newer(evt, old):
+                        stats['unchanged'] += 1
+                        if uid not in own:
+                            cached.pop(uid, None)
+                        continue
+                    evt.overrides = dict(old.overrides)
+                stats['added' if old is None else 'updated'] += 1
+                events[uid] = evt
+                own.add(uid)
+                touched.discard(uid)
+            logging.info(f'imported "{path}": {dict(stats)}')
+        for (uid, rid), evt in orphans.items():
+            if uid in events:
+                add_override(uid, rid, evt)
+            else:
+                logging.warning(f'failed to add recurrence-specific override for UID {uid}')
+        for uid in touched:
+            # let backends serializing on assignment see the new overrides
+            events[uid] = events[uid]
+        cal.write()
+    return stats
+
+
+def read_event_file(path):
+    with open(path, 'rb') as f:
+        ical = icalendar.Calendar.from_ical(f.read())
+    events, __ = callib.events_from_components(ical.subcomponents)
+    return events
+
+
+class DirEvents(collections.abc.MutableMapping):
+    """UID -> Event mapping loaded in the background, recording changes
+
+    Accessing it waits until all files are loaded.
+    """
+    def __init__(self, futures):
+        self._futures = futures
+        self._data = None
+        self.files = {}
+        self.dirty = set()
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = {}
+            for path, future in self._futures.items():
+                try:
+                    events = future.result()
+                except Exception as e:
+                    logging.error(f'Failed to read event file "{path}": {e}')
+                    continue
+                for uid, evt in events.items():
+                    if uid in self._data:
+                        logging.warning(f'UID {uid} in "{path}" and "{self.files[uid]}"')
+                    self._data[uid] = evt
+                    self.files[uid] = path
+            self._futures = None
+        return self._data
+
+    def __getitem__(self, uid):
+        return self.data[uid]
+
+    def __setitem__(self, uid, evt):
+        self.data[uid] = evt
+        self.dirty.add(uid)
+
+    def __delitem__(self, uid):
+        del self.data[uid]
+        self.dirty.add(uid)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def snapshot(self):
+        return dict(self.data), set(self.dirty), dict(self.files)
+
+    def restore(self, state):
+        """Go back to a ``snapshot`` without marking anything changed"""
+        data, dirty, files = state
+        self._data, self.dirty, self.files = dict(data), set(dirty), dict(files)
+
+
+class DirCalendar(callib.CalendarBase):
+    """vdir-style calendar: one .ics file per event and its overrides
+
+    Files are parsed in parallel in the background. ``write`` only
+    touches the files of events changed since the last write.
+    """
+    def __init__(self, directory):
+        self.file = directory
+        pool = concurrent.futures.ThreadPoolExecutor(LOAD_THREADS)
+        self.events = DirEvents({
+            entry.path: pool.submit(read_event_file, entry.path)
+            for entry in os.scandir(directory)
+            if entry.name.endswith('.ics') and entry.is_file()
+        })
+        pool.shutdown(wait=False)
+
+    def path_for(self, uid):
+        try:
+            return self.events.files[uid]
+        except KeyError:
+            name = urllib.parse.quote(uid, safe='') + '.ics'
+            return self.events.files.setdefault(uid, os.path.join(self.file, name))
+
+    def _write(self):
+        for uid in sorted(self.events.dirty):
+            path = self.path_for(uid)
+            if uid in self.events:
+                ical = new_ical()
+                ical.subcomponents = [
+                    *callib.vtimezones([self.events[uid]]), *self.events[uid].to_components()]
+                tmp = path + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(ical.to_ical())
+                os.replace(tmp, path)
+            else:
+                del self.events.files[uid]
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        self.events.dirty.clear()
+
+
+def archive_path(file):
+    """Return the archive file of ``file``, e.g. a.archive.ics.gz for a.ics.gz"""
+    base, ext = os.path.splitext(file)
+    if ext in callib.COMPRESSED_SUFFIXES:
+        base, inner = os.path.splitext(base)
+        ext = inner + ext
+    return base + '.archive' + ext
+
+
+def archive_cutoff(months):
+    """Return the start of the month ``months`` months before the current one"""
+    today = datetime.date.today()
+    year, month = divmod(today.year * 12 + today.month - 1 - months, 12)
+    return callib.force_tz(datetime.date(year, month + 1, 1))
+
+
+def load_archives(calendars, start=None):
+    """Load the archives of ``calendars`` holding events before ``start``
+
+    ``start`` None loads all of them. Returns the UIDs added.
+    """
+    added = set()
+    for cal in calendars:
+        if isinstance(cal, ArchivingCalendar) and (start is None or callib.force_tz(start) < cal.cutoff):
+            added |= cal.load_archive()
+    return added
+
+
+class ArchivingCalendar(callib.Calendar):
+    """Single-file calendar keeping finished events in a side archive file
+
+    When writing, events whose last occurrence ended before ``cutoff``
+    are moved to the archive (see ``archive_path``). The archive is only
+    read by ``load_archive``, once something before ``cutoff`` is needed,
+    so loading and writing usually only pay for recent events.
+    """
+    def __init__(self, file, months):
+        super().__init__(file)
+        self.cutoff = archive_cutoff(months)
+        self.archive_file = archive_path(file)
+        self.archive = None  # UID -> Event as last read or written
+        self.archive_comps = []
+        self._finished = {}  # UID -> (Event, whether it ended before cutoff)
+
+    def finished(self, evt):
+        cached = self._finished.get(evt.uid)
+        if cached is None or cached[0] is not evt:
+            end = callib.last_end(evt)
+            cached = self._finished[evt.uid] = evt, end is not None and end < self.cutoff
+        return cached[1]
+
+    def load_archive(self):
+        """Add the archived events to ``events``; return their UIDs"""
+        if self.archive is not None:
+            return set()
+        try:
+            archive = callib.Calendar(self.archive_file)
+        except FileNotFoundError:
+            self.archive = {}
+            self.archive_comps = [c for c in self.other_comps if c.name == 'VTIMEZONE']
+            return set()
+        self.archive = archive.events
+        self.archive_comps = archive.other_comps
+        added = archive.events.keys() - self.events.keys()
+        for uid in added:
+            self.events[uid] = archive.events[uid]
+        logging.info(f'loaded {len(added)} archived events of "{self.file}"')
+        return added
+
+    def _write(self):
+        if self.archive is None and any(map(self.finished, self.events.values())):
+            self.load_archive()
+        if self.archive is None:
+            super()._write()
+            return
+        self._finished = {uid: v for uid, v in self._finished.items() if uid in self.events}
+        archived = {uid: evt for uid, evt in self.events.items() if self.finished(evt)}
+        if archived.keys() != self.archive.keys() \
+                or any(evt is not self.archive[uid] for uid, evt in archived.items()):
+            self.write_file(self.archive_file, archived.values(), self.archive_comps)
+            self.archive = archived
+        self.write_file(
+            self.file,
+            (evt for uid, evt in self.events.items() if uid not in archived),
+            self.other_comps,
+        )
+
+
+def parse_vevents(text):
+    """Parse VEVENT text as stored by SQLiteCalendar into UID -> Event"""
+    ical = icalendar.Calendar.from_ical(f'BEGIN:VCALENDAR\r\n{text}END:VCALENDAR\r\n')
+    events, __ = callib.events_from_components(ical.subcomponents)
+    return events
+
+
+def occurrence_rows(evt, start, end):
+    for occ in callib.filter_events((evt,), start, end):
+        rid = next((dt for dt, e in evt.overrides.items() if e is occ.event), None)
+        yield (evt.uid, occ.start.timestamp(), occ.end.timestamp(),
+               None if rid is None else rid.timestamp())
+
+
+class SQLiteEvents(collections.abc.MutableMapping):
+    """UID -> Event mapping backed by SQLiteCalendar's tables
+
+    Events are parsed on first access and then kept. Stored events are
+    not, so writing many does not hold them all in memory.
+    """
+    def __init__(self, cal):
+        self.cal = cal
+        self.parsed = {}
+
+    def __getitem__(self, uid):
+        if uid not in self.parsed:
+            row = self.cal.db.execute(
+                'SELECT vevents FROM events WHERE uid = ?', (uid,)).fetchone()
+            if row is None:
+                raise KeyError(uid)
+            self.parsed[uid] = parse_vevents(row[0])[uid]
+        return self.parsed[uid]
+
+    def __setitem__(self, uid, evt):
+        self.cal.store(evt)
+        self.parsed.pop(uid, None)
+
+    def __delitem__(self, uid):
+        if not self.cal.db.execute('DELETE FROM events WHERE uid = ?', (uid,)).rowcount:
+            raise KeyError(uid)
+        self.cal.db.execute('DELETE FROM occurrences WHERE uid = ?', (uid,))
+        self.parsed.pop(uid, None)
+
+    def __iter__(self):
+        return (uid for uid, in self.cal.db.execute('SELECT uid FROM events'))
+
+    def __len__(self):
+        return self.cal.db.execute('SELECT count(*) FROM events').fetchone()[0]
+
+    def __contains__(self, uid):
+        return uid in self.parsed or self.cal.db.execute(
+            'SELECT 1 FROM events WHERE uid = ?', (uid,)).fetchone() is not None
+
+
+class SQLiteCalendar(callib.CalendarBase):
+    """Calendar stored in an SQLite database
+
+    Besides the raw VEVENT text of every event, occurrences are kept in an
+    indexed table for a rolling horizon, so window queries (``filter``)
+    are range scans. Changes are committed by ``write``.
+    """
+    schema = '''
+        CREATE TABLE IF NOT EXISTS events (
+            uid TEXT PRIMARY KEY,
+            vevents TEXT NOT NULL,
+            first_start REAL NOT NULL,
+            last_end REAL  -- NULL for indefinite series
+        );
+        CREATE INDEX IF NOT EXISTS events_first_start ON events (first_start);
+        CREATE TABLE IF NOT EXISTS occurrences (
+            uid TEXT NOT NULL,
+            start REAL NOT NULL,
+            end REAL NOT NULL,
+            recurrence_id REAL  -- set for overridden occurrences
+        );
+        CREATE INDEX IF NOT EXISTS occurrences_start ON occurrences (start);
+        CREATE INDEX IF NOT EXISTS occurrences_uid ON occurrences (uid);
+        CREATE TABLE IF NOT EXISTS timezones (tzid TEXT PRIMARY KEY, vtimezone TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value);
+    '''
+
+    def __init__(self, file):
+        self.file = file
+        self.db = sqlite3.connect(file)
+        self.db.executescript(self.schema)
+        for vtimezone, in self.db.execute('SELECT vtimezone FROM timezones'):
+            # makes icalendar know the zone when parsing events
+            icalendar.Component.from_ical(vtimezone)
+        self.events = SQLiteEvents(self)
+        now = datetime.datetime.now(dateutil.tz.UTC)
+        conf = config.get('sqlite_horizon')
+        self.horizon_start = self.get_meta('horizon_start', None)
+        self.horizon_end = self.get_meta('horizon_end', None)
+        self.max_duration = self.get_meta('max_duration', 0)
+        self.move_horizon(
+            (now - datetime.timedelta(days=conf['past'])).timestamp(),
+            (now + datetime.timedelta(days=conf['future'])).timestamp(),
+        )
+        self.db.commit()
+
+    def get_meta(self, key, default):
+        row = self.db.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.set_meta(key, default)
+            return default
+        return row[0]
+
+    def set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    def move_horizon(self, new_start, new_end):
+        """Make the occurrence table cover ``new_start``-``new_end`` (timestamps)
+
+        Rows ending before the new start are dropped, and only the parts
+        not covered yet are expanded. The end never moves back.
+        """
+        old_start, old_end = self.horizon_start, self.horizon_end
+        if old_start is None or new_start >= old_end or new_end <= old_start:
+            self.db.execute('DELETE FROM occurrences')
+            self.add_rows(new_start, new_end)
+        else:
+            if new_start > old_start:
+                self.db.execute('DELETE FROM occurrences WHERE end < ?', (new_start,))
+            elif new_start < old_start:
+                self.db.execute('DELETE FROM occurrences WHERE start < ?', (old_start,))
+                self.add_rows(new_start, old_start, lambda row: row[1] < old_start)
+            if new_end > old_end:
+                self.add_rows(old_end, new_end, lambda row: row[1] >= old_end)
+            new_end = max(new_end, old_end)
+        self.horizon_start, self.horizon_end = new_start, new_end
+        self.set_meta('horizon_start', new_start)
+        self.set_meta('horizon_end', new_end)
+
+    def add_rows(self, start, end, keep=None):
+        """Insert the occurrence rows in ``start``-``end`` of all events, if ``keep(row)``"""
+        for uid, in self.db.execute(
+                'SELECT uid FROM events WHERE first_start <= ? AND'
+                ' (last_end IS NULL OR last_end >= ?)', (end, start)
+        ).fetchall():
+            rows = [row for row in occurrence_rows(self.events[uid], *map(utc_from_ts, (start, end)))
+                    if keep is None or keep(row)]
+            self.db.executemany('INSERT INTO occurrences VALUES (?, ?, ?, ?)', rows)
+            self.note_duration(rows)
+
+    def note_duration(self, rows):
+        """Track the longest occurrence, which bounds the scan in ``filter``"""
+        duration = max((end - start for __, start, end, __ in rows), default=0)
+        if duration > self.max_duration:
+            self.max_duration = duration
+            self.set_meta('max_duration', duration)
+
+    def store(self, evt, vevents=None):
+        """Insert or replace ``evt``; ``vevents`` is its raw VEVENT text"""
+        if vevents is None:
+            vevents = ''.join(c.to_ical().decode() for c in evt.to_components())
+        self.db.executemany('INSERT OR REPLACE INTO timezones VALUES (?, ?)', (
+            (str(c['tzid']), c.to_ical().decode()) for c in callib.vtimezones([evt])))
+        last_end = callib.last_end(evt)
+        first_start = min((evt.start, *(e.start for e in evt.overrides.values())))
+        self.db.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?)', (
+            evt.uid, vevents, first_start.timestamp(),
+            None if last_end is None else last_end.timestamp(),
+        ))
+        self.db.execute('DELETE FROM occurrences WHERE uid = ?', (evt.uid,))
+        rows = list(occurrence_rows(
+            evt, *map(utc_from_ts, (self.horizon_start, self.horizon_end))))
+        self.db.executemany('INSERT INTO occurrences VALUES (?, ?, ?, ?)', rows)
+        self.note_duration(rows)
+
+    def filter(self, start, end, expand=None):
+        """Yield occurrences overlapping ``start``-``end``, sorted by start
+
+        Inside the horizon this is a range scan of the occurrence table;
+        outside, only the events whose span overlaps it are expanded.
+        """
+        ts_start, ts_end = start.timestamp(), end.timestamp()
+        if self.horizon_start <= ts_start and ts_end <= self.horizon_end:
+            rows = self.db.execute(
+                'SELECT uid, start, end, recurrence_id FROM occurrences'
+                ' WHERE start >= ? AND start < ? AND end > ? ORDER BY start',
+                (ts_start - self.max_duration, ts_end, ts_start),
+            ).fetchall()
+            for uid, o_start, o_end, rid in rows:
+                evt = self.events[uid]
+                if rid is None:
+                    yield callib.Occurrence(evt, *map(local_from_ts, (o_start, o_end)))
+                else:
+                    override = evt.overrides[local_from_ts(rid)]
+                    yield callib.Occurrence(override, override.start, override.end, True)
+        else:
+            candidates = self.db.execute(
+                'SELECT uid FROM events WHERE first_start <= ?'
+                ' AND (last_end IS NULL OR last_end >= ?)', (ts_end, ts_start),
+            ).fetchall()
+            yield from (expand or callib.sorted_occurrences)(
+                [self.events[uid] for uid, in candidates], start, end)
+
+    @contextlib.contextmanager
+    def batch(self):
+        if not self.db.in_transaction:
+            self.db.execute('BEGIN')
+        savepoint = f'batch{self._batch_depth}'
+        self.db.execute(f'SAVEPOINT {savepoint}')
+        self._batch_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.db.execute(f'ROLLBACK TO {savepoint}')
+            self.events.parsed.clear()
+            raise
+        finally:
+            self._batch_depth -= 1
+            self.db.execute(f'RELEASE {savepoint}')
+        if not self._batch_depth and self._write_pending:
+            self.write()
+
+    def _write(self):
+        self.db.commit()
+
+    def export(self, path):
+        """Write all events to a single .ics file, using the stored text"""
+        with callib.opener_for(path)(path, 'wt', encoding='utf-8', newline='') as f:
+            f.write(new_ical().to_ical().decode().replace('END:VCALENDAR\r\n', ''))
+            for vtimezone, in self.db.execute('SELECT vtimezone FROM timezones'):
+                f.write(vtimezone)
+            for vevents, in self.db.execute('SELECT vevents FROM events'):
+                f.write(vevents)
+            f.write('END:VCALENDAR\r\n')
+
+
+def utc_from_ts(ts):
+    return datetime.datetime.fromtimestamp(ts, dateutil.tz.UTC)
+
+
+def local_from_ts(ts):
+    return datetime.datetime.fromtimestamp(ts, dateutil.tz.gettz())
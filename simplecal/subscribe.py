@@ -0,0 +1,137 @@
+"""calendars subscribed by URL"""
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+import icalendar
+from . import callib
+from . import config
+
+cache_dir = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'simplecal', 'subscriptions',
+)
+URL_PREFIXES = ('http://', 'https://')
+
+
+def parse_ics(data):
+    events, __ = callib.events_from_components(icalendar.Calendar.from_ical(data).subcomponents)
+    return events
+
+
+class RemoteCalendar(callib.CalendarBase):
+    """Read-only calendar fetched from an http(s) URL
+
+    The last response is cached on disk with its ETag and Last-Modified,
+    so startup does not wait for the network and refreshing an unchanged
+    feed costs a 304 without reparsing. Refreshes run on a background
+    thread, which only downloads; ``take_update`` parses new data on the
+    main thread, so warnings are reported there.
+    """
+    def __init__(self, url, refresh=None):
+        self.file = self.url = url
+        self.refresh = config.get('subscription_refresh') if refresh is None else refresh
+        name = hashlib.sha256(url.encode()).hexdigest()
+        self.cache_file = os.path.join(cache_dir, name + '.ics')
+        self.meta_file = os.path.join(cache_dir, name + '.json')
+        self.meta = {}
+        self.events = {}
+        self._update = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._fetched = threading.Event()  # set after the first attempt
+        try:
+            with open(self.meta_file) as f:
+                self.meta = json.load(f)
+            with open(self.cache_file, 'rb') as f:
+                self.events = parse_ics(f.read())
+        except (OSError, ValueError):
+            # fetched in the background right away
+            self.meta = {}
+            delay = 0
+        else:
+            self._fetched.set()
+            delay = self.refresh
+        self.thread = threading.Thread(target=self.run, args=(delay,), daemon=True)
+        self.thread.start()
+
+    def fetch(self):
+        """Return the new data, or None if the feed has not changed"""
+        headers = {}
+        if 'etag' in self.meta:
+            headers['If-None-Match'] = self.meta['etag']
+        if 'last_modified' in self.meta:
+            headers['If-Modified-Since'] = self.meta['last_modified']
+        request = urllib.request.Request(self.url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                data = response.read()
+                meta = {
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                    'fetched': email.utils.formatdate(usegmt=True),
+                }
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                logging.debug('%s not modified', self.url)
+                return None
+            raise
+        self.meta = {k: v for k, v in meta.items() if v is not None}
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(self.cache_file, 'wb') as f:
+            f.write(data)
+        with open(self.meta_file, 'w') as f:
+            json.dump(self.meta, f)
+        logging.info('fetched %s (%d bytes)', self.url, len(data))
+        return data
+
+    def run(self, delay):
+        while not self._stop.wait(delay):
+            try:
+                data = self.fetch()
+            except (OSError, ValueError) as e:
+                logging.info('failed to refresh %s: %s', self.url, e)
+            else:
+                if data is not None:
+                    with self._lock:
+                        self._update = data
+            self._fetched.set()
+            delay = self.refresh
+
+    def take_update(self):
+        """Return the events fetched since the last call, or None
+
+        Must be called from the thread using ``events``, which parses
+        them. The caller is responsible for replacing ``events`` wherever
+        it is referenced.
+        """
+        with self._lock:
+            data, self._update = self._update, None
+        if data is None:
+            return None
+        try:
+            return parse_ics(data)
+        except ValueError as e:
+            logging.warning(f'Failed to parse "{self.url}": {e}')
+            self.meta = {}  # fetch it in full next time
+            return None
+
+    def wait_loaded(self, timeout=60):
+        """Without a cache, wait for the first fetch and use its events
+
+        For use without the GUI, which picks up new events with ``take_update``.
+        """
+        if self._fetched.wait(timeout):
+            events = self.take_update()
+            if events is not None:
+                self.events = events
+
+    def stop(self):
+        self._stop.set()
+
+    def _write(self):
+        raise OSError(f'subscribed calendar {self.url} is read-only')